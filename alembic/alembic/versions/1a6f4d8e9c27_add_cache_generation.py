@@ -0,0 +1,30 @@
+"""add_cache_generation
+
+Revision ID: 1a6f4d8e9c27
+Revises: e7d19b5c3a80
+Create Date: 2026-10-18 22:05:31.402718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6f4d8e9c27'
+down_revision = 'e7d19b5c3a80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    cache_generation = op.create_table(
+        'cache_generation',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(cache_generation, [{'name': 'classroom', 'generation': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('cache_generation')
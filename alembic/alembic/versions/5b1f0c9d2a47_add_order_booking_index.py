@@ -0,0 +1,28 @@
+"""add_order_booking_index
+
+Revision ID: 5b1f0c9d2a47
+Revises: 32edd08dd080
+Create Date: 2026-10-18 10:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c9d2a47'
+down_revision = '32edd08dd080'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_order_booking',
+        'order',
+        ['classroomId', 'orderStatus', 'start_time', 'end_time'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_booking', table_name='order')
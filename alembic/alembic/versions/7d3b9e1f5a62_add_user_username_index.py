@@ -0,0 +1,24 @@
+"""add_user_username_index
+
+Revision ID: 7d3b9e1f5a62
+Revises: 1a6f4d8e9c27
+Create Date: 2026-10-18 16:41:05.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b9e1f5a62'
+down_revision = '1a6f4d8e9c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_username', 'user', ['username'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_username', table_name='user')
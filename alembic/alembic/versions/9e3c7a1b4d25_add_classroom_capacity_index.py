@@ -0,0 +1,24 @@
+"""add_classroom_capacity_index
+
+Revision ID: 9e3c7a1b4d25
+Revises: 5b1f0c9d2a47
+Create Date: 2026-10-18 14:03:12.224911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3c7a1b4d25'
+down_revision = '5b1f0c9d2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_classroom_capacity', 'classroom', ['capacity'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_classroom_capacity', table_name='classroom')
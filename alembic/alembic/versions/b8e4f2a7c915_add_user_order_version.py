@@ -0,0 +1,27 @@
+"""add_user_order_version
+
+Revision ID: b8e4f2a7c915
+Revises: 7d3b9e1f5a62
+Create Date: 2026-10-18 23:12:47.560391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4f2a7c915'
+down_revision = '7d3b9e1f5a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('orderVersion', sa.Integer(), nullable=False, server_default='0'))
+    cache_generation = sa.table('cache_generation', sa.column('name', sa.String), sa.column('generation', sa.Integer))
+    op.bulk_insert(cache_generation, [{'name': 'booking', 'generation': 0}])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM cache_generation WHERE name = 'booking'")
+    op.drop_column('user', 'orderVersion')
@@ -0,0 +1,26 @@
+"""add_order_series_id
+
+Revision ID: c4a8e2f61b3d
+Revises: 9e3c7a1b4d25
+Create Date: 2026-10-18 21:02:47.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8e2f61b3d'
+down_revision = '9e3c7a1b4d25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('order', sa.Column('seriesId', sa.String(length=32), nullable=True))
+    op.create_index('ix_order_seriesId', 'order', ['seriesId'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_seriesId', table_name='order')
+    op.drop_column('order', 'seriesId')
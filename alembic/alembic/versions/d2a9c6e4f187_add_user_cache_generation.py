@@ -0,0 +1,25 @@
+"""add_user_cache_generation
+
+Revision ID: d2a9c6e4f187
+Revises: b8e4f2a7c915
+Create Date: 2026-10-18 23:48:20.917354
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a9c6e4f187'
+down_revision = 'b8e4f2a7c915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    cache_generation = sa.table('cache_generation', sa.column('name', sa.String), sa.column('generation', sa.Integer))
+    op.bulk_insert(cache_generation, [{'name': 'user', 'generation': 0}])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM cache_generation WHERE name = 'user'")
@@ -0,0 +1,24 @@
+"""add_classroom_booking_version
+
+Revision ID: e7d19b5c3a80
+Revises: c4a8e2f61b3d
+Create Date: 2026-10-18 21:34:09.871254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7d19b5c3a80'
+down_revision = 'c4a8e2f61b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('classroom', sa.Column('bookingVersion', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('classroom', 'bookingVersion')
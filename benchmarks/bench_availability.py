@@ -0,0 +1,65 @@
+"""Compare the SQL range check with the in-process availability index.
+
+Usage: python -m benchmarks.bench_availability [orders] [checks] [hot_classrooms]
+
+Probes go to a few hot classrooms so the index is built once per classroom
+and then reused. "index" is is_classroom_free_in_range with the index
+enabled (one version read per check), "index lookup" is the bisection
+alone, the lower bound for a worker that trusts its index.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import create_engine
+
+from benchmarks.bench_overlap import BASE_TIME, CLASSROOMS, seed, run
+from classroom_booking import availability, db_utils
+from classroom_booking.models import Session, Order
+from classroom_booking.schedule import OrderIntervals
+
+
+def main(orders=200000, checks=5000, hot_classrooms=5):
+    path = os.path.join(tempfile.mkdtemp(), "bench_availability.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Session.remove()
+    Session.configure(bind=engine)
+    seed(engine, orders)
+
+    span = 2 * (orders // CLASSROOMS)
+    rnd = random.Random(42)
+    probes = []
+    for _ in range(checks):
+        start = BASE_TIME + timedelta(hours=rnd.randint(0, span), minutes=30)
+        probes.append((rnd.randint(1, hot_classrooms), start, start + timedelta(hours=1)))
+
+    availability.index.enabled = False
+    sql = run(db_utils.is_classroom_free_in_range, probes)
+
+    availability.index.enabled = True
+    availability.index.clear()
+    began = time.perf_counter()
+    for classroomid in range(1, hot_classrooms + 1):
+        db_utils.is_classroom_free_in_range(classroomid, BASE_TIME, BASE_TIME)
+    build = time.perf_counter() - began
+    indexed = run(db_utils.is_classroom_free_in_range, probes)
+
+    session = Session()
+    rooms = {classroomid: OrderIntervals(session.query(Order.start_time, Order.end_time)
+                                         .filter_by(classroomId=classroomid, orderStatus='placed'))
+             for classroomid in range(1, hot_classrooms + 1)}
+    lookup = run(lambda classroomid, start, end: not rooms[classroomid].overlaps(start, end), probes)
+
+    for name, elapsed in (("range predicate", sql), ("index", indexed), ("index lookup", lookup)):
+        print(f"{name:20} {checks / elapsed:10.0f} checks/s  {elapsed * 1e6 / checks:8.1f} us/check")
+    print(f"index build          {build * 1e3 / hot_classrooms:10.1f} ms/classroom "
+          f"({orders // CLASSROOMS} orders each)")
+
+    Session.remove()
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:4]))
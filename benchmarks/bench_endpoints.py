@@ -0,0 +1,334 @@
+"""Latency and throughput of every route in openapi.yaml, compared to a baseline.
+
+Usage: python -m benchmarks.bench_endpoints [--iterations N] [--users N] [--classrooms N]
+           [--orders N] [--output FILE] [--baseline FILE] [--save-baseline] [--threshold 0.2]
+
+Seeds a throwaway SQLite file with generate_data (or uses --db-url as is
+with --no-seed) and drives each route through the Flask test client with
+a Bearer token of the first, admin, user. Writes go to classrooms created
+for the run, so the seeded data stays comparable between routes. Routes
+hashing passwords run at most --bcrypt-iterations times.
+
+Per route p50/p95/p99 (ms, nearest rank) and requests/s are written to
+--output as JSON. With --baseline every route whose p50, p95 or p99 grew,
+or whose throughput fell, by more than --threshold is flagged and the exit
+status is 1; --save-baseline stores this run as the new baseline instead.
+Routes of openapi.yaml the app does not serve are listed, not timed.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import insert, select
+
+from classroom_booking import tokens
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPEC = os.path.join(ROOT, "openapi.yaml")
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+# method is the one the app serves when it differs from the spec, a build of
+# None marks a spec route that is not implemented.
+Scenario = namedtuple('Scenario', ['method', 'build', 'bcrypt'], defaults=(False,))
+
+
+def spec_routes(path=SPEC):
+    """["GET /user/self", ...] in spec order, without a YAML parser."""
+    routes = []
+    current = None
+    with open(path) as spec:
+        for line in spec:
+            match = re.match(r"^  (/\S*):\s*$", line)
+            if match:
+                current = match.group(1)
+                continue
+            match = re.match(r"^    (get|post|put|delete|patch):\s*$", line)
+            if match and current is not None:
+                routes.append(f"{match.group(1).upper()} {current}")
+            elif re.match(r"^\S", line):
+                current = None
+    return routes
+
+
+def percentile(latencies, p):
+    return latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)]
+
+
+class Bench:
+    """Routes to time and the rows they need; models is classroom_booking.models,
+    imported once DB_URL points at the benchmark database."""
+
+    def __init__(self, app, models, users, classrooms, password):
+        self.app = app
+        self.models = models
+        self.engine = models.engine
+        self.client = app.test_client()
+        self.users = users
+        self.classrooms = classrooms
+        self.run = int(time.time())
+        self.slots = Counter()
+        self.future = datetime(2100, 1, 1)
+
+        basic = base64.b64encode(f"user1:{password}".encode()).decode()
+        self.basic = {"Authorization": "Basic " + basic}
+        token = self.client.get("/user_login", headers=self.basic).json["token"]
+        self.headers = {"Authorization": "Bearer " + token}
+
+        Classroom, Order = models.Classroom, models.Order
+        with self.engine.begin() as connection:
+            # Rooms for the write routes, so their slots never collide.
+            rooms = [{"name": f"bench{self.run}{name}", "capacity": 30}
+                     for name in ("order", "batch", "series", "cancel")]
+            connection.execute(insert(Classroom), rooms)
+            self.rooms = dict(zip(("order", "batch", "series", "cancel"), connection.execute(
+                select(Classroom.id).where(Classroom.name.in_([x["name"] for x in rooms])).order_by(Classroom.id)
+            ).scalars()))
+            self.own_orders = connection.execute(
+                select(Order.id).where(Order.userId == 1).limit(1000)).scalars().all()
+        if not self.own_orders:
+            self.own_orders = [self.insert_order("order")]
+        self.series_id = self.client.post("/booking/series", headers=self.headers,
+                                          json=self.series_json(0)).json["seriesId"]
+
+    def slot(self, room):
+        """Next free 2 hour slot of a write room."""
+        self.slots[room] += 1
+        return self.future + timedelta(hours=2 * self.slots[room])
+
+    def insert_order(self, room, series_id=None):
+        start = self.slot(room)
+        with self.engine.begin() as connection:
+            result = connection.execute(insert(self.models.Order), {"classroomId": self.rooms[room], "userId": 1,
+                                                        "start_time": start, "end_time": start + timedelta(hours=1),
+                                                        "orderStatus": 'placed', "seriesId": series_id})
+        return result.inserted_primary_key[0]
+
+    def insert_user(self, name):
+        with self.engine.begin() as connection:
+            result = connection.execute(insert(self.models.User), {"username": name, "firstName": "bench", "lastName": "bench",
+                                                       "email": f"{name}@example.com", "password": "x",
+                                                       "userStatus": '1', "isAdmin": '0'})
+        return result.inserted_primary_key[0]
+
+    def series_json(self, i):
+        # Ten weekly occurrences, every series starts ten weeks after the last one.
+        start = self.future + timedelta(weeks=10 * i)
+        return {"classroomId": self.rooms["series"],
+                "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "end_time": (start + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S"),
+                "until": (start + timedelta(weeks=9)).strftime("%Y-%m-%d %H:%M:%S")}
+
+    def token_for_new_user(self, i):
+        name = f"self{self.run}x{i}"
+        user = SimpleNamespace(id=self.insert_user(name), username=name, password="x", userStatus='1')
+        return {"Authorization": "Bearer " + tokens.issue_token(user)}
+
+    def scenarios(self):
+        h = self.headers
+        time_format = "%Y-%m-%d %H:%M:%S"
+        window = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+        def order_json(room):
+            start = self.slot(room)
+            return {"classroomId": self.rooms[room],
+                    "start_time": start.strftime(time_format),
+                    "end_time": (start + timedelta(hours=1)).strftime(time_format)}
+
+        def new_series(i):
+            series_id = uuid.uuid4().hex
+            for _ in range(3):
+                self.insert_order("cancel", series_id)
+            return series_id
+
+        def new_user(i):
+            name = f"gone{self.run}x{i}"
+            self.insert_user(name)
+            return name
+
+        def new_classroom(i):
+            with self.engine.begin() as connection:
+                return connection.execute(insert(self.models.Classroom), {"name": f"gone{self.run}x{i}", "capacity": 5}) \
+                    .inserted_primary_key[0]
+
+        return {
+            "POST /user": Scenario("POST", lambda i: ("/user", {"json": {
+                "username": f"new{self.run}x{i}", "firstName": "bench", "lastName": "bench",
+                "email": f"new{self.run}x{i}@example.com", "password": "bench", "phone": "+380961010101",
+                "birthDate": "2000-01-01"}}), bcrypt=True),
+            "POST /user/bulk": Scenario("POST", lambda i: ("/user/bulk", {"headers": h, "json": {"users": [{
+                "username": f"bulk{self.run}x{i}x{k}", "firstName": "bench", "lastName": "bench",
+                "email": f"bulk{self.run}x{i}x{k}@example.com", "password": "bench"} for k in range(10)]}}),
+                bcrypt=True),
+            "GET /user_login": Scenario("GET", lambda i: ("/user_login", {"headers": self.basic}), bcrypt=True),
+            "GET /user/self": Scenario("GET", lambda i: ("/user/self", {"headers": h})),
+            "PUT /user/self": Scenario("PUT", lambda i: ("/user/self", {"headers": h,
+                                                                       "json": {"firstName": f"bench{i % 10}"}})),
+            "DELETE /user/self": Scenario("DELETE", lambda i: ("/user/self", {"headers": self.token_for_new_user(i)})),
+            "GET /user/{user_id}": Scenario("GET", lambda i: (f"/user/{1 + i % self.users}", {"headers": h})),
+            "GET /user/{user_name}": Scenario("GET", lambda i: (f"/user/user{1 + i % self.users}", {"headers": h})),
+            "DELETE /user/{user_name}": Scenario("DELETE", lambda i: (f"/user/{new_user(i)}", {"headers": h})),
+            "POST /classroom": Scenario("POST", lambda i: ("/classroom", {"headers": h, "json": {
+                "name": f"new{self.run}x{i}", "capacity": 20}})),
+            # A read, served through POST because the statuses come in the body.
+            "GET /classroom/findByStatus": Scenario("POST", lambda i: ("/classroom/findByStatus", {
+                "headers": h, "json": {"status": ["available", "unavailable"]}})),
+            "GET /classroom/available": Scenario("GET", lambda i: ("/classroom/available", {"headers": h, "query_string": {
+                "start": (window + timedelta(hours=i % 48)).isoformat(),
+                "end": (window + timedelta(hours=i % 48 + 2)).isoformat()}})),
+            "GET /classroom/{classroomId}/schedule": Scenario("GET", lambda i: (
+                f"/classroom/{1 + i % self.classrooms}/schedule", {"headers": h, "query_string": {
+                    "from": window.isoformat(), "to": (window + timedelta(days=7)).isoformat()}})),
+            "GET /classroom/{classroomId}": Scenario("GET", lambda i: (f"/classroom/{1 + i % self.classrooms}",
+                                                                      {"headers": h})),
+            "PUT /classroom/{classroomId}": Scenario("PUT", lambda i: (f"/classroom/{1 + i % self.classrooms}", {
+                "headers": h, "json": {"capacity": 10 + i % 191}})),
+            "DELETE /classroom/{classroomId}": Scenario("DELETE", lambda i: (f"/classroom/{new_classroom(i)}",
+                                                                            {"headers": h})),
+            "GET /booking/findByStatus": Scenario("GET", lambda i: ("/booking/findByStatus", {
+                "headers": h, "json": {"status": ["placed"]}})),
+            "POST /booking/order": Scenario("POST", lambda i: ("/booking/order", {"headers": h,
+                                                                                  "json": order_json("order")})),
+            "POST /booking/orders/batch": Scenario("POST", lambda i: ("/booking/orders/batch", {"headers": h, "json": {
+                "orders": [order_json("batch") for _ in range(50)]}})),
+            "POST /booking/series": Scenario("POST", lambda i: ("/booking/series", {"headers": h,
+                                                                                    "json": self.series_json(i + 1)})),
+            "GET /booking/series/{seriesId}": Scenario("GET", lambda i: (f"/booking/series/{self.series_id}",
+                                                                        {"headers": h})),
+            "DELETE /booking/series/{seriesId}": Scenario("DELETE", lambda i: (f"/booking/series/{new_series(i)}",
+                                                                              {"headers": h})),
+            "GET /booking/order/{order_id}": Scenario("GET", lambda i: (
+                f"/booking/order/{self.own_orders[i % len(self.own_orders)]}", {"headers": h})),
+            "PUT /booking/order/{order_id}": Scenario("PUT", None),
+            "DELETE /booking/order/{order_id}": Scenario("DELETE", lambda i: (
+                f"/booking/order/{self.insert_order('order')}", {"headers": h})),
+            "GET /booking/ordersby/{userid}": Scenario("GET", lambda i: (f"/booking/ordersby/{1 + i % self.users}",
+                                                                        {"headers": h})),
+            "GET /booking/ordersby/me": Scenario("GET", lambda i: ("/booking/ordersby/me", {"headers": h})),
+            "GET /pool/stats": Scenario("GET", lambda i: ("/pool/stats", {"headers": h})),
+            "GET /cache/stats": Scenario("GET", lambda i: ("/cache/stats", {"headers": h})),
+            "GET /metrics": Scenario("GET", lambda i: ("/metrics", {})),
+        }
+
+    def measure(self, scenario, iterations, warmup):
+        latencies = []
+        statuses = Counter()
+        total = 0.0
+        for i in range(warmup + iterations):
+            # Preparation in build(), like inserting the row a DELETE removes, is not timed.
+            url, kwargs = scenario.build(i)
+            began = time.perf_counter()
+            resp = self.client.open(url, method=scenario.method, **kwargs)
+            resp.get_data()
+            elapsed = time.perf_counter() - began
+            if i >= warmup:
+                latencies.append(elapsed)
+                statuses[resp.status_code] += 1
+                total += elapsed
+
+        latencies.sort()
+        return {"n": iterations,
+                **{name: round(percentile(latencies, p) * 1000, 3) for name, p in zip(METRICS, (50, 95, 99))},
+                "rps": round(iterations / total, 1),
+                "statuses": {str(code): count for code, count in sorted(statuses.items())}}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for route, current in results.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        for name in METRICS:
+            if before[name] > 0 and current[name] > before[name] * (1 + threshold):
+                regressions.append(f"{route}: {name} {before[name]} -> {current[name]}")
+        if current["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{route}: rps {before['rps']} -> {current['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--bcrypt-iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--classrooms", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db-url", help="database to use instead of a fresh SQLite file")
+    parser.add_argument("--no-seed", action="store_true", help="the database is already seeded")
+    parser.add_argument("--routes", help="regular expression selecting the routes to run")
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    os.environ["DB_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_endpoints.db")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    sys.path.insert(0, ROOT)
+    import generate_data
+    from classroom_booking.app import app
+    from classroom_booking import models
+
+    if not args.no_seed:
+        generate_data.generate(args.users, args.classrooms, args.orders, args.password,
+                               create_tables=args.db_url is None)
+
+    with app.app_context():
+        bench = Bench(app, models, args.users, args.classrooms, args.password)
+        scenarios = bench.scenarios()
+
+        routes = spec_routes()
+        results = {}
+        for route in routes + [x for x in scenarios if x not in routes]:
+            if args.routes and not re.search(args.routes, route):
+                continue
+            scenario = scenarios.get(route)
+            if scenario is None or scenario.build is None:
+                print(f"{route:40} not served by the app")
+                continue
+            iterations = args.bcrypt_iterations if scenario.bcrypt else args.iterations
+            results[route] = bench.measure(scenario, iterations, 0 if scenario.bcrypt else args.warmup)
+            r = results[route]
+            errors = sum(count for code, count in r["statuses"].items() if not code.startswith("2"))
+            print(f"{route:40} p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms"
+                  f"  {r['rps']:8.1f} req/s" + (f"  {errors} non-2xx {r['statuses']}" if errors else ""))
+
+    run = {"meta": {"date": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "database": models.engine.dialect.name,
+                    "users": args.users, "classrooms": args.classrooms, "orders": args.orders,
+                    "iterations": args.iterations},
+           "results": results}
+    with open(args.output, "w") as output:
+        json.dump(run, output, indent=2, sort_keys=True)
+    print(f"results written to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(run, output, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)["results"], args.threshold)
+        for line in regressions:
+            print("REGRESSION " + line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regression above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the legacy four-query overlap check with the single range query.
+
+Usage: python -m benchmarks.bench_overlap [orders] [checks]
+
+Runs against a throwaway SQLite file so it does not touch the configured
+MySQL database.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.sql import exists
+
+from classroom_booking import db_utils
+from classroom_booking.models import BaseModel, Session, Classroom, Order
+
+CLASSROOMS = 200
+BASE_TIME = datetime(2030, 1, 1)
+
+
+def legacy_is_classroom_free_in_range(classroomid, start_time, end_time):
+    session = Session()
+    ranges = (
+        (Order.start_time <= start_time, start_time < Order.end_time),
+        (Order.start_time < end_time, end_time <= Order.end_time),
+        (start_time <= Order.start_time, Order.start_time < end_time),
+        (start_time < Order.end_time, Order.end_time <= end_time),
+    )
+    for lower, upper in ranges:
+        if session.query(exists().where(Order.classroomId == classroomid,
+                                        Order.orderStatus == 'placed',
+                                        lower, upper)).scalar():
+            return False
+    return True
+
+
+def seed(engine, orders):
+    BaseModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Classroom), [{"id": i, "name": str(i), "capacity": 30}
+                                         for i in range(1, CLASSROOMS + 1)])
+        batch = []
+        for i in range(orders):
+            start = BASE_TIME + timedelta(hours=2 * (i // CLASSROOMS))
+            batch.append({"classroomId": i % CLASSROOMS + 1,
+                          "start_time": start,
+                          "end_time": start + timedelta(hours=1),
+                          "orderStatus": 'placed'})
+            if len(batch) == 10000:
+                conn.execute(insert(Order), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Order), batch)
+
+
+def run(check, probes):
+    began = time.perf_counter()
+    for classroomid, start, end in probes:
+        check(classroomid, start, end)
+    return time.perf_counter() - began
+
+
+def main(orders=200000, checks=2000):
+    path = os.path.join(tempfile.mkdtemp(), "bench_overlap.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Session.remove()
+    Session.configure(bind=engine)
+    seed(engine, orders)
+
+    span = 2 * (orders // CLASSROOMS)
+    rnd = random.Random(42)
+    probes = []
+    for _ in range(checks):
+        start = BASE_TIME + timedelta(hours=rnd.randint(0, span), minutes=30)
+        probes.append((rnd.randint(1, CLASSROOMS), start, start + timedelta(hours=1)))
+
+    for name, check in (("legacy (4 queries)", legacy_is_classroom_free_in_range),
+                        ("range predicate", db_utils.is_classroom_free_in_range)):
+        elapsed = run(check, probes)
+        print(f"{name:20} {checks / elapsed:10.0f} checks/s  {elapsed * 1e6 / checks:8.1f} us/check")
+
+    Session.remove()
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:3]))
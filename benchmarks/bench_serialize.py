@@ -0,0 +1,43 @@
+"""Serialize orders with per-row OrderData() instances, a reused marshmallow
+schema and the compiled dump path.
+
+Usage: python -m benchmarks.bench_serialize [orders]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from classroom_booking.models import Order
+from classroom_booking.schemas import OrderData, order_data_schema, dump_order_data
+
+
+def make_orders(count):
+    base = datetime(2030, 1, 1)
+    return [Order(id=i, classroomId=i % 500, userId=i % 10000,
+                  start_time=base + timedelta(hours=i),
+                  end_time=base + timedelta(hours=i + 1),
+                  orderStatus='placed')
+            for i in range(count)]
+
+
+def main(count=100000):
+    orders = make_orders(count)
+    paths = (
+        ("OrderData() per row", lambda: [OrderData().dump(x) for x in orders]),
+        ("schema singleton", lambda: order_data_schema.dump(orders, many=True)),
+        ("compiled dump", lambda: dump_order_data(orders, many=True)),
+    )
+
+    expected = None
+    for name, run in paths:
+        began = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - began
+        if expected is None:
+            expected = result
+        assert result == expected, name
+        print(f"{name:20} {elapsed:7.3f} s  {count / elapsed:10.0f} orders/s")
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:2]))
@@ -0,0 +1,112 @@
+"""Throughput of the gunicorn entry point with 1, 4 and 8 workers.
+
+Usage: python -m benchmarks.bench_workers [seconds] [client_threads] [workers...]
+
+Seeds a SQLite file, starts `gunicorn -c gunicorn.conf.py
+classroom_booking.wsgi:app` for every worker count and hammers
+GET /booking/ordersby/me with a Bearer token from a thread pool.
+"""
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db_url):
+    os.environ["DB_URL"] = db_url
+    from flask_bcrypt import generate_password_hash
+    from classroom_booking.models import BaseModel, Session, User, Classroom, Order, engine
+
+    BaseModel.metadata.create_all(engine)
+    session = Session()
+    session.add(User(username="bench", firstName="bench", lastName="bench",
+                     email="bench@gmail.com", birthDate=date(2000, 1, 1),
+                     password=generate_password_hash("bench", rounds=4)))
+    session.add_all(Classroom(name=f"room{i}", capacity=30) for i in range(20))
+    session.flush()
+    start = datetime(2030, 1, 1)
+    session.add_all(Order(classroomId=i % 20 + 1, userId=1,
+                          start_time=start + timedelta(hours=i),
+                          end_time=start + timedelta(hours=i + 1))
+                    for i in range(50))
+    session.commit()
+    Session.remove()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+        else:
+            return
+    raise RuntimeError("gunicorn did not start")
+
+
+def get(url, headers):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=10) as resp:
+        return resp.read()
+
+
+def run(workers, seconds, client_threads, env):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**env, "WEB_BIND": f"127.0.0.1:{port}", "WEB_WORKERS": str(workers)}
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                "classroom_booking.wsgi:app"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(base + "/user_login", process)
+        basic = {"Authorization": "Basic " + base64.b64encode(b"bench:bench").decode()}
+        token = json.loads(get(base + "/user_login", basic))["token"]
+        headers = {"Authorization": "Bearer " + token}
+        url = base + "/booking/ordersby/me"
+
+        def client(_):
+            done = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                get(url, headers)
+                done += 1
+            return done
+
+        with ThreadPoolExecutor(max_workers=client_threads) as pool:
+            total = sum(pool.map(client, range(client_threads)))
+        return total / seconds
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main(seconds=10, client_threads=16, *worker_counts):
+    db_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_workers.db")
+    seed(db_url)
+    env = {**os.environ, "DB_URL": db_url, "SECRET_KEY": "bench-secret", "WEB_THREADS": "1"}
+
+    for workers in worker_counts or (1, 4, 8):
+        print(f"{workers:2} workers: {run(workers, seconds, client_threads, env):8.0f} requests/s")
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,93 @@
+"""Soak test: replay a mix of requests and report commits per request and
+resident memory over time.
+
+Usage: python -m benchmarks.soak [requests] [report_every]
+"""
+import base64
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from flask_bcrypt import generate_password_hash
+from sqlalchemy import create_engine, event
+
+from classroom_booking.app import app
+from classroom_booking.models import BaseModel, Session, SessionFactory, User, Classroom
+
+CLASSROOMS = 50
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def seed():
+    session = Session()
+    session.add(User(username="soak", firstName="soak", lastName="soak",
+                     email="soak@gmail.com", birthDate=date(2000, 1, 1),
+                     password=generate_password_hash("soak", rounds=4)))
+    session.add_all(Classroom(name=f"room{i}", capacity=30) for i in range(CLASSROOMS))
+    session.commit()
+    Session.remove()
+
+
+def requests(client, headers):
+    start = datetime(2030, 1, 1, 8)
+    i = 0
+    while True:
+        booking_start = start + timedelta(hours=2 * (i // CLASSROOMS))
+        yield lambda: client.get("/user/self", headers=headers)
+        yield lambda: client.post("/classroom/findByStatus", json={"status": ["available"]}, headers=headers)
+        yield lambda: client.get("/booking/ordersby/me", headers=headers)
+        yield lambda s=booking_start, c=i % CLASSROOMS + 1: client.post(
+            "/booking/order", headers=headers,
+            json={"classroomId": c,
+                  "start_time": s.strftime("%Y-%m-%d %H:%M:%S"),
+                  "end_time": (s + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")})
+        i += 1
+
+
+def main(count=20000, report_every=2000):
+    path = os.path.join(tempfile.mkdtemp(), "soak.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Session.remove()
+    Session.configure(bind=engine)
+    BaseModel.metadata.create_all(engine)
+    seed()
+
+    commits = 0
+
+    def after_commit(session):
+        nonlocal commits
+        commits += 1
+
+    event.listen(SessionFactory, "after_commit", after_commit)
+
+    client = app.test_client()
+    headers = {"Authorization": "Basic " + base64.b64encode(b"soak:soak").decode()}
+    calls = requests(client, headers)
+
+    print(f"{'requests':>10} {'commits/req':>12} {'rss MB':>8} {'req/s':>8}")
+    began = time.perf_counter()
+    window_commits = 0
+    for n in range(1, count + 1):
+        resp = next(calls)()
+        assert resp.status_code < 500, resp.get_data(as_text=True)
+        if n % report_every == 0:
+            elapsed = time.perf_counter() - began
+            print(f"{n:10} {(commits - window_commits) / report_every:12.2f} {rss_mb():8.1f} {n / elapsed:8.0f}")
+            window_commits = commits
+
+    event.remove(SessionFactory, "after_commit", after_commit)
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:3]))
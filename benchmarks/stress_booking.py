@@ -0,0 +1,98 @@
+"""Fire overlapping POST /booking/order requests from many threads.
+
+Usage: python -m benchmarks.stress_booking [requests] [threads] [classrooms]
+
+Runs against a throwaway SQLite file, asserts that no two placed orders of
+the same classroom overlap and reports accepted orders per second.
+"""
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from flask_bcrypt import generate_password_hash
+from sqlalchemy import create_engine
+
+from classroom_booking.app import app
+from classroom_booking.models import BaseModel, Session, User, Classroom, Order
+
+BASE_TIME = datetime(2030, 1, 1, 8)
+
+
+def seed(classrooms):
+    session = Session()
+    session.add(User(username="stress", firstName="stress", lastName="stress",
+                     email="stress@gmail.com", birthDate=date(2000, 1, 1),
+                     password=generate_password_hash("stress", rounds=4)))
+    session.add_all(Classroom(name=f"room{i}", capacity=30) for i in range(classrooms))
+    session.commit()
+    Session.remove()
+
+
+def make_payloads(count, classrooms):
+    rnd = random.Random(7)
+    payloads = []
+    for _ in range(count):
+        start = BASE_TIME + timedelta(hours=rnd.randint(0, 48))
+        end = start + timedelta(hours=rnd.randint(1, 4))
+        payloads.append({"classroomId": rnd.randint(1, classrooms),
+                         "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+                         "end_time": end.strftime("%Y-%m-%d %H:%M:%S")})
+    return payloads
+
+
+def assert_no_overlaps():
+    orders = Session().query(Order.classroomId, Order.start_time, Order.end_time) \
+        .filter_by(orderStatus='placed') \
+        .order_by(Order.classroomId, Order.start_time) \
+        .all()
+    Session.remove()
+
+    for classroomid, rows in groupby(orders, key=lambda x: x.classroomId):
+        previous_end = None
+        for row in rows:
+            assert previous_end is None or row.start_time >= previous_end, \
+                f"classroom {classroomid} is double-booked at {row.start_time}"
+            previous_end = row.end_time
+
+    return len(orders)
+
+
+def main(count=2000, threads=16, classrooms=5):
+    path = os.path.join(tempfile.mkdtemp(), "stress_booking.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    Session.remove()
+    Session.configure(bind=engine)
+    BaseModel.metadata.create_all(engine)
+    seed(classrooms)
+
+    headers = {"Authorization": "Basic " + base64.b64encode(b"stress:stress").decode()}
+    payloads = make_payloads(count, classrooms)
+
+    def post(payload):
+        client = app.test_client()
+        try:
+            return client.post("/booking/order", json=payload, headers=headers).status_code
+        finally:
+            Session.remove()
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(post, payloads))
+    elapsed = time.perf_counter() - began
+
+    placed = assert_no_overlaps()
+    print(f"requests: {count}  threads: {threads}  classrooms: {classrooms}")
+    print(f"accepted: {statuses.count(200)}  rejected: {statuses.count(400)}  "
+          f"other: {count - statuses.count(200) - statuses.count(400)}")
+    print(f"placed orders in db: {placed}  overlaps: 0")
+    print(f"{count / elapsed:.0f} requests/s, {statuses.count(200) / elapsed:.0f} orders/s")
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:4]))
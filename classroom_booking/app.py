@@ -1,14 +1,51 @@
 from flask import Flask
 
 from flask_cors import CORS
-app = Flask(__name__)
-CORS(app)
+from classroom_booking.config import Config
+from classroom_booking import models, availability, cache, hashing, metrics, db_utils
 
-from classroom_booking.blueprint import api_blueprint
-from classroom_booking.blueprint import errors
 
-app.register_blueprint(api_blueprint, url_prefix="")
-app.register_blueprint(errors, url_prefix="")
+def create_app(config=Config):
+    """Build the Flask app and configure the modules it uses for config.
+
+    The engine, caches and hashing pool are module-level and shared by the
+    whole process, so only one app per process is supported: a second
+    create_app() call reconfigures them for every app created before.
+    """
+    app = Flask(__name__)
+    # Browsers only let scripts read the headers listed here.
+    CORS(app, expose_headers=["X-Next-Cursor", "ETag", "Server-Timing", "Retry-After"])
+    app.config.from_object(config)
+    models.configure_engine(config)
+    availability.configure(config)
+    cache.configure(config)
+    hashing.configure(config)
+    metrics.init_app(app)
+
+    from classroom_booking.blueprint import api_blueprint
+    from classroom_booking.blueprint import errors
+
+    app.register_blueprint(api_blueprint, url_prefix="")
+    app.register_blueprint(errors, url_prefix="")
+
+    return app
+
+
+def warm_up(app):
+    """Prepare a freshly forked worker before it accepts requests.
+
+    Opens the pooled connections and loads the classroom cache, so first
+    requests pay for neither.
+    """
+    with app.app_context():
+        models.warm_up_pool(app.config["DB_POOL_SIZE"])
+        try:
+            db_utils.warm_classroom_cache()
+        finally:
+            models.Session.remove()
+
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
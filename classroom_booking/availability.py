@@ -0,0 +1,77 @@
+import threading
+
+from classroom_booking.config import Config
+from classroom_booking.schedule import OrderIntervals
+
+
+class AvailabilityIndex:
+    """Per-classroom OrderIntervals of placed orders, loaded lazily.
+
+    Every entry remembers the classroom's bookingVersion it was built for.
+    Writes in this process update the entry and its version in place once
+    they commit, so an entry whose version differs from the database was
+    changed by another worker and is rebuilt on the next check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+    def is_free(self, classroomid, start_time, end_time, version, load):
+        """Check the range against the index, rebuilding it from load() if stale.
+
+        version must be read before load() runs, so a rebuild that races with
+        a write is at worst marked older than its data and rebuilt again.
+        """
+        with self._lock:
+            entry = self._rooms.get(classroomid)
+            if entry is not None and entry[0] == version:
+                return not entry[1].overlaps(start_time, end_time)
+
+        intervals = OrderIntervals(load())
+        with self._lock:
+            self._rooms[classroomid] = [version, intervals]
+            self.rebuilds += 1
+            return not intervals.overlaps(start_time, end_time)
+
+    def booked(self, classroomid, start_time, end_time, version):
+        self._apply(classroomid, version, lambda intervals: intervals.add(start_time, end_time))
+
+    def cancelled(self, classroomid, start_time, end_time, version):
+        self._apply(classroomid, version, lambda intervals: intervals.remove(start_time, end_time))
+
+    def _apply(self, classroomid, version, change):
+        """Apply a committed local write that moved the classroom to version.
+
+        Only an entry exactly one version behind is updated in place. One
+        rebuilt after the commit already contains the write, any other is
+        dropped and rebuilt on the next check.
+        """
+        with self._lock:
+            entry = self._rooms.get(classroomid)
+            if entry is None or entry[0] == version:
+                return
+            if entry[0] == version - 1:
+                change(entry[1])
+                entry[0] = version
+            else:
+                del self._rooms[classroomid]
+
+    def invalidate(self, classroom_ids):
+        with self._lock:
+            for classroomid in classroom_ids:
+                self._rooms.pop(classroomid, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+index = AvailabilityIndex(Config.AVAILABILITY_INDEX)
+
+
+def configure(config):
+    index.enabled = config.AVAILABILITY_INDEX
+    index.clear()
@@ -1,31 +1,67 @@
 import datetime
+import hashlib
 import json
 import marshmallow
 import sqlalchemy
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from datetime import datetime
-from flask_httpauth import HTTPBasicAuth
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
 from flask_bcrypt import check_password_hash
-from flask import Blueprint, jsonify, request, make_response
-from classroom_booking import db_utils
-from classroom_booking.models import User, Classroom, Order
+from flask import Blueprint, jsonify, request, current_app, g, stream_with_context
+from classroom_booking import db_utils, tokens, cache, hashing, metrics, user_import
+from classroom_booking.schedule import free_gaps, expand_recurrence
+from classroom_booking.models import User, Classroom, Order, pool_stats
 from classroom_booking.schemas import (
-    UserData,
-    CreateUser,
-    UpdateUser,
-    GetUser,
-    ClassroomData,
-    CreateClassroom,
-    OrderData,
-    PlaceOrder,
-    UpdateClassroom,
+    create_user_schema,
+    update_user_schema,
+    bulk_users_schema,
+    create_classroom_schema,
+    update_classroom_schema,
+    place_order_schema,
+    batch_orders_schema,
+    recurring_order_schema,
+    page_params_schema,
+    available_classrooms_params_schema,
+    schedule_params_schema,
+    dump_user_data,
+    dump_get_user,
+    dump_classroom_data,
+    dump_order_data,
+    dump_self_order_data,
+    encode_cursor,
 )
 
-auth = HTTPBasicAuth()
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+auth = MultiAuth(basic_auth, token_auth)
 api_blueprint = Blueprint('api', __name__)
 errors = Blueprint('errors', __name__)
 
 
+@api_blueprint.before_app_request
+def begin_request():
+    # g outlives the request when an app context was pushed beforehand
+    # (tests, CLI), so do not let a cached user leak between requests.
+    g.pop("current_user", None)
+    db_utils.begin_unit_of_work()
+
+
+@api_blueprint.after_app_request
+def commit_unit_of_work(response):
+    db_utils.commit_unit_of_work(commit=response.status_code < 400)
+    return response
+
+
+@api_blueprint.teardown_app_request
+def end_unit_of_work(exc):
+    db_utils.end_unit_of_work()
+
+
 @errors.app_errorhandler(sqlalchemy.exc.NoResultFound)
 def handle_error(error):
     response = {
@@ -65,14 +101,111 @@ def handle_error(error):
     return jsonify(response), 400
 
 
-def status_response(response, code):
-    param = response.json
+@errors.app_errorhandler(hashing.HashingUnavailable)
+def handle_error(error):
+    response = {
+        'code': 503,
+        'error': str(error)
+    }
+
+    return jsonify(response), 503, {"Retry-After": "1"}
+
+
+def dumps(obj):
+    """Compact JSON with sorted keys as bytes, like jsonify produces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+
+
+def status_response(param, code):
+    """JSON response with the status code added to the body in one pass."""
     if isinstance(param, list):
-        param.append({"code": code})
+        param = [*param, {"code": code}]
+    else:
+        param = {**param, "code": code}
+    with metrics.timed("serialize"):
+        body = dumps(param)
+    return current_app.response_class(body, code, mimetype="application/json")
+
+
+def page_response(page, ans, code):
+    """status_response for one page, the cursor of the next one goes to X-Next-Cursor."""
+    response = status_response(ans, code)
+    if page.next_after is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(page.next_after)
+    return response
+
+
+def wants_stream():
+    return request.args.get("stream") == "1" \
+        or request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def stream_response(rows, dump, code):
+    """NDJSON response written row by row, the last line carries the code."""
+    def generate():
+        for row in rows:
+            with metrics.timed("serialize"):
+                line = dumps(dump(row)) + b"\n"
+            yield line
+        yield dumps({"code": code}) + b"\n"
+
+    return current_app.response_class(stream_with_context(generate()), code, mimetype="application/x-ndjson")
+
+
+def list_response(fetch, dump):
+    """Paginated list response, or an NDJSON export of every row if requested."""
+    page_params = page_params_schema.load(request.args)
+    if wants_stream():
+        page = fetch(after=page_params["after"], limit=None)
+        return stream_response(page.items, dump, 200)
+
+    page = fetch(**page_params)
+    with metrics.timed("serialize"):
+        items = dump(page.items, many=True)
+    return page_response(page, items, 200)
+
+
+def etag_response(parts, build):
+    """Call build() only if the client's copy, identified by If-None-Match, is outdated.
+
+    parts must change whenever the body would; the ETag is their hash. Read
+    endpoints polled through POST get 304 as well.
+    """
+    etag = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
     else:
-        param.update({"code": code})
-    end_response = make_response(jsonify(param), code)
-    return end_response
+        response = build()
+
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+    return response
+
+
+def catalog_signal(signal):
+    # Classroom bodies come from cache.classrooms, which must not be older
+    # than the catalog generation the signal, and so the ETag, starts with.
+    if signal is not None:
+        cache.classrooms.sync_to(signal[0])
+    return signal
+
+
+def availability_signal():
+    signal = catalog_signal(db_utils.booking_signal())
+    return (*signal, *db_utils.next_availability_change(signal))
+
+
+def booking_range_error(start_time, end_time):
+    if start_time > end_time:
+        return "Start time must be earlier than End time"
+
+    seconds = (end_time - start_time).total_seconds()
+    if seconds < 3600 or seconds > 5 * 24 * 3600:
+        return "Booking time must be bigger or equal than 1 hour and smaller or equal than 5 days"
+
+    return None
 
 
 def validate_statuses(statuses):
@@ -101,73 +234,137 @@ def validate_statuses_orders(statuses):
     return True
 
 
+def current_user():
+    """Authenticated User, loaded at most once per request."""
+    if "current_user" not in g:
+        g.current_user = auth.current_user()
+
+    return g.current_user
+
+
+def current_user_entry():
+    """Authenticated User row, token checks only load a CachedUser."""
+    user = current_user()
+    if isinstance(user, db_utils.CachedUser):
+        user = db_utils.get_entry_by_id(User, user.id)
+
+    return user
+
+
 def admin_required(func):
     def wrapper(*args, **kwargs):
-        username = auth.current_user()
-        user = db_utils.get_entry_by_name(User, username)
+        user = current_user()
         if user.isAdmin == '1':
             return func(*args, **kwargs)
         else:
-            return status_response(jsonify({"error": f"User must be an admin to use {func.__name__}."}), 401)
+            return status_response({"error": f"User must be an admin to use {func.__name__}."}, 401)
 
     wrapper.__name__ = func.__name__
     return wrapper
 
 
 @api_blueprint.route("/login")
-@auth.verify_password
+@basic_auth.verify_password
 def login(username, password):
-    if username == '0' or not db_utils.is_name_taken(User, username):
+    if username == '0':
         return False
 
-    user = db_utils.get_entry_by_name(User, username)
+    user = db_utils.find_entry_by_name(User, username)
 
-    if check_password_hash(user.password, password):
-        return True
+    if user is None:
+        return False
+
+    with metrics.timed("bcrypt"):
+        valid = check_password_hash(user.password, password)
+    if valid:
+        return user
 
     return False
 
 
+@token_auth.verify_token
+def login_token(token):
+    payload = tokens.verify_token(token)
+    if payload is None:
+        return False
+
+    # The revocation list only knows this worker's revocations, the password
+    # fingerprint catches the ones made by any other worker once cache.users
+    # has synced. Most requests find the user cached and need no query.
+    user = db_utils.get_cached_user(payload["id"])
+    if user is None or tokens.password_fingerprint(user) != payload["fp"]:
+        return False
+
+    return user
+
+
 @api_blueprint.route("/user_login")
 @auth.login_required()
 def user_login():
-    return status_response(jsonify({"message": "Successfully signed in"}), 200)
+    user = current_user()
+    return status_response({"message": "Successfully signed in",
+                            "token": tokens.issue_token(user),
+                            "expires_in": current_app.config["TOKEN_TTL"]}, 200)
 
 
 @api_blueprint.route('/user', methods=["POST"])
 def create_user():
-    user_data = CreateUser().load(request.json)
+    user_data = create_user_schema.load(request.json)
     if db_utils.is_name_taken(User, user_data["username"]):
-        return status_response(jsonify({"error": "User with entered username already exists"}), 402)
+        return status_response({"error": "User with entered username already exists"}, 402)
 
     user = db_utils.create_entry(User, **user_data)
-    return status_response(jsonify(UserData().dump(user)), 200)
+    return status_response(dump_user_data(user), 200)
+
+
+@api_blueprint.route('/user/bulk', methods=["POST"])
+@auth.login_required
+@admin_required
+def create_users_bulk():
+    if request.mimetype == "text/csv":
+        batch = bulk_users_schema.load({"users": user_import.read_csv(request.get_data(as_text=True)),
+                                        "mode": request.args.get("mode", "all_or_nothing")})
+    else:
+        batch = bulk_users_schema.load(request.json)
+
+    max_rows = current_app.config["BULK_USERS_MAX_ROWS"]
+    if len(batch["users"]) > max_rows:
+        return status_response({"error": f"At most {max_rows} users per request, "
+                                         "import larger files with import_users.py"}, 400)
+
+    created, errors = user_import.import_users(batch["users"], partial=batch["mode"] == "partial",
+                                               timeout=current_app.config["HASH_BULK_TIMEOUT"])
+
+    code = 200 if created or not errors else 400
+    return status_response({"mode": batch["mode"], "created": len(created),
+                            "results": user_import.results(len(batch["users"]), created, errors)}, code)
 
 
 @api_blueprint.route('/user/self', methods=["GET", "DELETE", "PUT"])
 @auth.login_required
 def user_self():
-    username = auth.current_user()
-    user = db_utils.get_entry_by_name(User, username)
+    user = current_user_entry()
     selfid = user.id
     if request.method == 'GET':
-        user = db_utils.get_entry_by_id(User, selfid)
-        return status_response(jsonify(UserData().dump(user)), 200)
+        return status_response(dump_user_data(user), 200)
 
     if request.method == 'DELETE':
-        user = db_utils.get_entry_by_id(User, selfid)
         user_data = {"userStatus": '0',
                      "username": '0'}
         db_utils.update_entry(user, **user_data)
-        return status_response(jsonify(UserData().dump(user)), 200)
+        tokens.revoke_tokens(selfid)
+        db_utils.invalidate_user(selfid)
+        return status_response(dump_user_data(user), 200)
 
     if request.method == 'PUT':
-        user_data = UpdateUser().load(request.json)
+        user_data = update_user_schema.load(request.json)
 
-        user = db_utils.get_entry_by_id(User, selfid)
         db_utils.update_entry(user, **user_data)
+        if "password" in user_data:
+            tokens.revoke_tokens(selfid)
+            db_utils.invalidate_user(selfid)
 
-        return status_response(jsonify(GetUser().dump(user)), 200)
+        return status_response(dump_get_user(user), 200)
 
 
 @api_blueprint.route('/user/<int:user_id>', methods=["GET"])
@@ -175,7 +372,7 @@ def user_self():
 @admin_required
 def get_user_by_id(user_id):
     user = db_utils.get_entry_by_id(User, user_id)
-    return status_response(jsonify(GetUser().dump(user)), 200)
+    return status_response(dump_get_user(user), 200)
 
 
 @api_blueprint.route('/user/<string:user_name>', methods=["DELETE", "GET"])
@@ -188,73 +385,110 @@ def user_admin(user_name):
         user_data = {"userStatus": '0',
                      "username": '0'}
         db_utils.update_entry(user, **user_data)
+        tokens.revoke_tokens(user.id)
+        db_utils.invalidate_user(user.id)
 
-        return status_response(jsonify(GetUser().dump(user)), 200)
+        return status_response(dump_get_user(user), 200)
 
     if request.method == "GET":
         user = db_utils.get_entry_by_name(User, user_name)
-        return status_response(jsonify(GetUser().dump(user)), 200)
+        return status_response(dump_get_user(user), 200)
 
 
 @api_blueprint.route('/classroom', methods=["POST"])
 @auth.login_required
 @admin_required
 def create_classroom():
-    classroom_data = CreateClassroom().load(request.json)
+    classroom_data = create_classroom_schema.load(request.json)
 
     if db_utils.is_name_taken(Classroom, classroom_data["name"]):
-        return status_response(jsonify({"error": "Classroom with entered name already exists"}), 403)
+        return status_response({"error": "Classroom with entered name already exists"}, 403)
 
     user = db_utils.create_entry(Classroom, **classroom_data)
-    return status_response(jsonify(ClassroomData().dump(user)), 200)
+    db_utils.invalidate_classroom(user.id)
+    return status_response(dump_classroom_data(user), 200)
 
 
 @api_blueprint.route('/classroom/findByStatus', methods=["POST"])
 @auth.login_required
 def find_classroom_by_status():
     if not validate_statuses(request.json["status"]):
-        return status_response(jsonify({"error": "Invalid status value(s). "
-                                                 "Should be list with maximum size = 2, "
-                                                 "elements should be strings \'available' or 'unavailable' "}), 400)
+        return status_response({"error": "Invalid status value(s). "
+                                         "Should be list with maximum size = 2, "
+                                         "elements should be strings \'available' or 'unavailable' "}, 400)
+
+    params = request.json
+    return etag_response(("classrooms", params["status"], request.query_string, wants_stream(),
+                          *availability_signal()),
+                         lambda: list_response(
+                             lambda **page: db_utils.get_list_of_classrooms_by_1or2_statuses(params, **page),
+                             dump_classroom_data))
 
-    db_utils.reload_classroom_statuses()
 
-    classrooms = db_utils.get_list_of_classrooms_by_1or2_statuses(request.json)
-    ans = [ClassroomData().dump(x) for x in classrooms]
+@api_blueprint.route('/classroom/available', methods=["GET"])
+@auth.login_required
+def find_available_classrooms():
+    params = available_classrooms_params_schema.load(request.args)
+    classrooms = db_utils.find_available_classrooms(params["start"], params["end"],
+                                                    params["min_capacity"], params["limit"])
+
+    return status_response(dump_classroom_data(classrooms, many=True), 200)
 
-    return status_response(jsonify(ans), 200)
+
+@api_blueprint.route('/classroom/<int:classroom_id>/schedule', methods=["GET"])
+@auth.login_required
+def classroom_schedule(classroom_id):
+    params = schedule_params_schema.load(request.args)
+    if not db_utils.is_id_taken(Classroom, classroom_id):
+        return status_response({"error": "Classroom with entered id does not found"}, 404)
+
+    booked = db_utils.find_booked_intervals(classroom_id, params["start"], params["end"])
+    free = free_gaps([(x.start_time, x.end_time) for x in booked], params["start"], params["end"])
+
+    time_format = "%Y-%m-%d %H:%M:%S"
+    return status_response({
+        "classroomId": classroom_id,
+        "from": params["start"].strftime(time_format),
+        "to": params["end"].strftime(time_format),
+        "booked": [{"id": x.id,
+                    "start_time": x.start_time.strftime(time_format),
+                    "end_time": x.end_time.strftime(time_format)} for x in booked],
+        "free": [{"start_time": start.strftime(time_format),
+                  "end_time": end.strftime(time_format)} for start, end in free],
+    }, 200)
 
 
 @api_blueprint.route('/classroom/<int:classroom_id>', methods=["GET", "PUT", "DELETE"])
 @auth.login_required
 @admin_required
 def classroom(classroom_id):
-    db_utils.reload_classroom_statuses()
-
-    classroom = db_utils.get_entry_by_id(Classroom, classroom_id)
-
     if request.method == "GET":
-        return status_response(jsonify(ClassroomData().dump(classroom)), 200)
+        signal = catalog_signal(db_utils.classroom_signal(classroom_id))
+        return etag_response(("classroom", classroom_id, signal),
+                             lambda: status_response(dump_classroom_data(db_utils.get_cached_classroom(classroom_id)),
+                                                     200))
+
+    classroom = db_utils.get_classroom_by_id(classroom_id)
 
     if request.method == "PUT":
-        classroom_data = UpdateClassroom().load(request.json)
+        classroom_data = update_classroom_schema.load(request.json)
         db_utils.update_entry(classroom, **classroom_data)
+        db_utils.invalidate_classroom(classroom_id)
+        classroom = db_utils.get_classroom_by_id(classroom_id)
 
-        return status_response(jsonify(ClassroomData().dump(classroom)), 200)
+        return status_response(dump_classroom_data(classroom), 200)
 
     if request.method == "DELETE":
         db_utils.delete_entry(classroom)
+        db_utils.invalidate_classroom(classroom_id)
 
-        return status_response(jsonify({"message": "deleted"}), 200)
+        return status_response({"message": "deleted"}, 200)
 
 
 @api_blueprint.route('/booking/order', methods=["POST"])
 @auth.login_required
 def place_order():
-    username = auth.current_user()
-    db_utils.reload_classroom_statuses()
-    user = db_utils.get_entry_by_name(User, username)
-    selfid = user.id
+    selfid = current_user().id
 
     param = request.json
     param.update({"userId": selfid})
@@ -263,7 +497,7 @@ def place_order():
     # if not db_utils.is_id_taken(User, request.json['userId']):
     #     return status_response({"error": "User with entered id does not found"}, 404)
 
-    order_data = PlaceOrder().load(json.loads(paramjson))
+    order_data = place_order_schema.load(json.loads(paramjson))
 
     start_time = request.json['start_time']
     end_time = request.json['end_time']
@@ -271,70 +505,140 @@ def place_order():
     d1 = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
     d2 = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
 
-    if d1 > d2:
-        return status_response(jsonify({"error": "Start time must be earlier than End time"}), 400)
-
-    if (d2 - d1).total_seconds() < 3600 or (d2 - d1).total_seconds() > 5 * 24 * 3600:
-        return status_response(jsonify({"error": "Booking time must be bigger or equal "
-                                                 "than 1 hour and smaller or equal than 5 days"}), 400)
+    range_error = booking_range_error(d1, d2)
+    if range_error is not None:
+        return status_response({"error": range_error}, 400)
 
     if not db_utils.is_id_taken(Classroom, request.json['classroomId']):
-        return status_response(jsonify({"error": "Classroom with entered id does not found"}), 404)
+        return status_response({"error": "Classroom with entered id does not found"}, 404)
+
+    order_ = db_utils.book_classroom(**order_data)
+    if order_ is None:
+        return status_response({"error": "This classroom will be unavailable in entered period of time"}, 400)
+
+    return status_response(dump_order_data(order_), 200)
 
-    if not db_utils.is_classroom_free_in_range(request.json['classroomId'], d1, d2):
-        return status_response(jsonify({"error": "This classroom will be unavailable in entered period of time"}), 400)
 
-    order_ = db_utils.create_order(**order_data)
+@api_blueprint.route('/booking/orders/batch', methods=["POST"])
+@auth.login_required
+def place_orders_batch():
+    selfid = current_user().id
+    batch = batch_orders_schema.load(request.json)
+    partial = batch["mode"] == "partial"
+
+    bookings = []
+    errors = {}
+    for index, item in enumerate(batch["orders"]):
+        try:
+            booking = place_order_schema.load({**item, "userId": selfid})
+        except marshmallow.exceptions.ValidationError as error:
+            errors[index] = str(error.args[0])
+            continue
+
+        range_error = booking_range_error(booking["start_time"], booking["end_time"])
+        if range_error is not None:
+            errors[index] = range_error
+            continue
+
+        bookings.append((index, booking))
+
+    placed = {}
+    if bookings and (partial or not errors):
+        placed, conflicts = db_utils.book_classrooms_batch(selfid, [x for _, x in bookings], partial=partial)
+        placed = {bookings[i][0]: order_ for i, order_ in placed.items()}
+        errors.update({bookings[i][0]: error for i, error in conflicts.items()})
+
+    results = []
+    for index in range(len(batch["orders"])):
+        if index in placed:
+            results.append({"index": index, "status": "placed", "order": dump_order_data(placed[index])})
+        else:
+            results.append({"index": index, "status": "rejected",
+                            "error": errors.get(index, "Not placed because another order in the batch failed")})
+
+    code = 200 if placed or not errors else 400
+    return status_response({"mode": batch["mode"], "placed": len(placed), "results": results}, code)
+
+
+def series_response(series_id, orders, code, **extra):
+    return status_response({"seriesId": series_id,
+                            "classroomId": orders[0].classroomId,
+                            "orders": dump_order_data(orders, many=True),
+                            **extra}, code)
+
+
+@api_blueprint.route('/booking/series', methods=["POST"])
+@auth.login_required
+def place_series():
+    selfid = current_user().id
+    series = recurring_order_schema.load(request.json)
+
+    range_error = booking_range_error(series["start_time"], series["end_time"])
+    if range_error is not None:
+        return status_response({"error": range_error}, 400)
 
-    return status_response(jsonify(OrderData().dump(order_)), 200)
+    if not db_utils.is_id_taken(Classroom, series["classroomId"]):
+        return status_response({"error": "Classroom with entered id does not found"}, 404)
+
+    occurrences = expand_recurrence(series["start_time"], series["end_time"], series["step"], series["until"])
+    orders, conflicts = db_utils.book_series(selfid, series["classroomId"], occurrences)
+    if conflicts:
+        time_format = "%Y-%m-%d %H:%M:%S"
+        return status_response({"error": "This classroom will be unavailable in entered period of time",
+                                "conflicts": [{"start_time": start.strftime(time_format),
+                                               "end_time": end.strftime(time_format)} for start, end in conflicts]},
+                               400)
+
+    return series_response(orders[0].seriesId, orders, 200)
+
+
+@api_blueprint.route('/booking/series/<string:series_id>', methods=["GET", "DELETE"])
+@auth.login_required
+def series(series_id):
+    orders = db_utils.find_series_orders(series_id)
+    if not orders:
+        return status_response({"error": "Not found"}, 404)
+
+    if current_user().id != orders[0].userId:
+        return status_response({"error": "This series is not yours"}, 402)
+
+    if request.method == "GET":
+        return series_response(series_id, orders, 200)
+
+    if request.method == "DELETE":
+        cancelled = db_utils.cancel_series(series_id)
+        orders = db_utils.find_series_orders(series_id)
+
+        return series_response(series_id, orders, 200, cancelled=cancelled)
 
 
 @api_blueprint.route('/booking/order/<int:order_id>', methods=["GET", "DELETE"])
 @auth.login_required
 def order(order_id):
-    db_utils.reload_classroom_statuses()
     order_ = db_utils.get_entry_by_id(Order, order_id)
-    username = auth.current_user()
-    user = db_utils.get_entry_by_name(User, username)
-    selfid = user.id
+    selfid = current_user().id
 
     if selfid != order_.userId:
-        return status_response(jsonify({"error": "This order is not yours"}), 402)
+        return status_response({"error": "This order is not yours"}, 402)
 
     if request.method == "GET":
-        return status_response(jsonify(OrderData().dump(order_)), 200)
+        return status_response(dump_order_data(order_), 200)
 
     if request.method == "DELETE":
-        order_data = {"orderStatus": "denied"}
-        db_utils.update_entry(order_, **order_data)
+        db_utils.cancel_order(order_)
 
-        return status_response(jsonify(OrderData().dump(order_)), 200)
+        return status_response(dump_order_data(order_), 200)
 
 
 @api_blueprint.route('/booking/ordersby/me', methods=["GET"])
 @auth.login_required
 def get_self_orders():
-    username = auth.current_user()
-    db_utils.reload_classroom_statuses()
-    user = db_utils.get_entry_by_name(User, username)
-    userid = user.id
-    orders = db_utils.find_placed_orders_by_userid(userid)
-    ans = [OrderData().dump(x) for x in orders]
-
-    for el in ans:
-        end_time = el['end_time']
-        end_time = end_time[:10] + ' ' + end_time[12:]
-        el['end_time'] = end_time
-
-        start_time = el['start_time']
-        start_time = start_time[:10] + ' ' + start_time[12:]
-        el['start_time'] = start_time
-
-        classroom = db_utils.get_entry_by_id(Classroom, el['classroomId'])
-        el['classroom_name'] = classroom.name
-        el['classroom_capacity'] = classroom.capacity
-
-    return status_response(jsonify(ans), 200)
+    userid = current_user().id
+    signal = catalog_signal(db_utils.user_orders_signal(userid))
+    return etag_response(("orders", userid, request.query_string, wants_stream(), signal),
+                         lambda: list_response(
+                             lambda **page: db_utils.find_placed_orders_with_classroom_by_userid(userid, **page),
+                             dump_self_order_data))
 
 
 @api_blueprint.route('/booking/ordersby/<int:userid>', methods=["GET"])
@@ -342,12 +646,10 @@ def get_self_orders():
 @admin_required
 def get_all_orders(userid):
     if not db_utils.is_id_taken(User, userid):
-        return status_response(jsonify({"error": "Not found"}), 404)
-
-    orders = db_utils.find_orders_by_userid(userid)
-    ans = [OrderData().dump(x) for x in orders]
+        return status_response({"error": "Not found"}, 404)
 
-    return status_response(jsonify(ans), 200)
+    return list_response(lambda **page: db_utils.find_orders_by_userid(userid, **page),
+                         dump_order_data)
 
 
 @api_blueprint.route('/booking/findByStatus', methods=["GET"])
@@ -355,11 +657,29 @@ def get_all_orders(userid):
 @admin_required
 def get_orders_by_status():
     if not validate_statuses_orders(request.json["status"]):
-        return status_response(jsonify({"error": "Invalid status value(s). "
-                                                 "Should be list with maximum size = 2, "
-                                                 "elements should be strings \'placed' or 'denied' "}), 400)
+        return status_response({"error": "Invalid status value(s). "
+                                         "Should be list with maximum size = 2, "
+                                         "elements should be strings \'placed' or 'denied' "}, 400)
+
+    params = request.json
+    return list_response(lambda **page: db_utils.get_list_of_orders_by_1or2_statuses(params, **page),
+                         dump_order_data)
+
+
+@api_blueprint.route('/pool/stats', methods=["GET"])
+@auth.login_required
+@admin_required
+def get_pool_stats():
+    return status_response(pool_stats(), 200)
+
+
+@api_blueprint.route('/cache/stats', methods=["GET"])
+@auth.login_required
+@admin_required
+def get_cache_stats():
+    return status_response({"classrooms": cache.classrooms.stats(), "users": cache.users.stats()}, 200)
 
-    orders = db_utils.get_list_of_orders_by_1or2_statuses(request.json)
-    ans = [OrderData().dump(x) for x in orders]
 
-    return status_response(jsonify(ans), 200)
+@api_blueprint.route('/metrics', methods=["GET"])
+def get_metrics():
+    return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+from classroom_booking.config import Config
+
+
+class TTLCache:
+    """Read-through TTL + LRU cache tied to a generation counter in the database.
+
+    Writers bump the counter (see db_utils.bump_cache_generation); a worker
+    reads it at most every sync_interval seconds and drops all entries when it
+    moved, so other workers' writes are seen after sync_interval at the
+    latest. A ttl or max_size of 0 disables caching.
+    """
+
+    def __init__(self, ttl, max_size, sync_interval):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sync_interval = sync_interval
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def sync(self, read_generation):
+        if self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+
+        self.sync_to(read_generation())
+
+    def sync_to(self, generation):
+        """Adopt a generation read by the caller, dropping entries made before it."""
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            self._synced_at = time.monotonic()
+
+    def get_many(self, keys, load, read_generation):
+        """Values for the keys, calling load(missing_keys) -> {key: value} for misses."""
+        if not self.enabled:
+            return load(keys)
+
+        self.sync(read_generation)
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            loaded = load(missing)
+            self.put_many(loaded, now)
+            found.update(loaded)
+
+        return found
+
+    def put_many(self, values, now=None):
+        """Store {key: value} as freshly loaded, e.g. to warm the cache up."""
+        if not self.enabled:
+            return
+
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation = None
+            self._synced_at = None
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries),
+                    "max_size": self.max_size,
+                    "ttl": self.ttl,
+                    "generation": self.generation,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+classrooms = TTLCache(Config.CLASSROOM_CACHE_TTL, Config.CLASSROOM_CACHE_SIZE, Config.CLASSROOM_CACHE_SYNC_INTERVAL)
+users = TTLCache(Config.USER_CACHE_TTL, Config.USER_CACHE_SIZE, Config.USER_CACHE_SYNC_INTERVAL)
+
+
+def configure(config):
+    classrooms.ttl = config.CLASSROOM_CACHE_TTL
+    classrooms.max_size = config.CLASSROOM_CACHE_SIZE
+    classrooms.sync_interval = config.CLASSROOM_CACHE_SYNC_INTERVAL
+    classrooms.clear()
+    users.ttl = config.USER_CACHE_TTL
+    users.max_size = config.USER_CACHE_SIZE
+    users.sync_interval = config.USER_CACHE_SYNC_INTERVAL
+    users.clear()
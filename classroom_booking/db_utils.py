@@ -1,8 +1,85 @@
-from sqlalchemy import select
-from classroom_booking.models import Session, User, Classroom, Order
+import threading
+import uuid
+from collections import namedtuple, defaultdict
+from itertools import islice
+
+from sqlalchemy import case, insert, func, event
+from sqlalchemy.orm import with_expression
+from sqlalchemy.exc import NoResultFound
+from classroom_booking.models import Session, SessionFactory, User, Classroom, Order, CacheGeneration
 from sqlalchemy.sql import exists
 from datetime import datetime
-from classroom_booking.schemas import ClassroomData
+from classroom_booking.schedule import IntervalSet
+from classroom_booking import availability, cache
+
+# Striped in-process locks so threads of one worker queue on a mutex instead
+# of piling up on the same classroom row lock in the database.
+_booking_locks = [threading.Lock() for _ in range(64)]
+
+Page = namedtuple('Page', ['items', 'next_after'])
+
+# (signal, computed at, next order start, next order end) of the last
+# next_availability_change() call, shared by the threads of the worker.
+_availability_change = None
+_availability_change_lock = threading.Lock()
+
+# Classroom row served from cache.classrooms, availability is filled per query.
+CachedClassroom = namedtuple('CachedClassroom', ['id', 'name', 'capacity', 'classroomStatus', 'availability'],
+                             defaults=(None,))
+# User fields token checks need, served from cache.users.
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'isAdmin', 'password', 'userStatus'])
+SelfOrder = namedtuple('SelfOrder', ['id', 'classroomId', 'userId', 'start_time', 'end_time', 'orderStatus',
+                                     'classroom_name', 'classroom_capacity'])
+
+
+def paginate(query, key, after=None, limit=100, batch_size=1000):
+    """Keyset pagination: rows with key > after, ordered by key.
+
+    next_after is the key of the last returned row when more rows exist,
+    otherwise None. With limit=None all remaining rows are returned as a lazy
+    iterator that fetches batch_size rows at a time (yield_per).
+    """
+    if after is not None:
+        query = query.filter(key > after)
+
+    query = query.order_by(key)
+    if limit is None:
+        return Page(query.yield_per(batch_size), None)
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        return Page(rows[:limit], rows[limit - 1].id)
+
+    return Page(rows, None)
+
+
+def begin_unit_of_work():
+    """Turn the helpers' commits into flushes until end_unit_of_work."""
+    Session().info["unit_of_work"] = True
+
+
+def commit_unit_of_work(commit=True):
+    session = Session()
+    has_writes = session.info.pop("flushed", False) or session.new or session.dirty or session.deleted
+    if commit and has_writes:
+        session.commit()
+    else:
+        # Read-only requests need no COMMIT, end_unit_of_work rolls back.
+        session.rollback()
+
+
+def end_unit_of_work():
+    # remove() rolls back whatever was not committed and drops the identity
+    # map together with the thread's session.
+    Session.remove()
+
+
+def save(session):
+    if session.info.get("unit_of_work"):
+        session.flush()
+        session.info["flushed"] = True
+    else:
+        session.commit()
 
 
 def create_entry(model_class, *, commit=True, **kwargs):
@@ -10,7 +87,7 @@ def create_entry(model_class, *, commit=True, **kwargs):
     entry = model_class(**kwargs)
     session.add(entry)
     if commit:
-        session.commit()
+        save(session)
     return entry
 
 
@@ -23,6 +100,29 @@ def is_name_taken(model_class, name):
         return session.query(exists().where(model_class.name == name)).scalar()
 
 
+def taken_usernames(names):
+    """The subset of names that belong to existing users, in one IN query."""
+    session = Session()
+    return {x for x, in session.query(User.username).filter(User.username.in_(names))}
+
+
+def create_users(users, batch_size=1000):
+    """Insert user dicts with multi-row INSERTs of batch_size rows.
+
+    Rows may leave optional columns out. Returns {username: id}, so the
+    usernames must not be taken.
+    """
+    session = Session()
+    columns = set().union(*users)
+    for start in range(0, len(users), batch_size):
+        session.execute(insert(User), [{column: user.get(column) for column in columns}
+                                       for user in users[start:start + batch_size]])
+
+    ids = dict(session.query(User.username, User.id).filter(User.username.in_([x["username"] for x in users])))
+    save(session)
+    return ids
+
+
 def is_id_taken(model_class, uid):
     session = Session()
     return session.query(exists().where(model_class.id == uid)).scalar()
@@ -38,12 +138,17 @@ def get_entry_by_name(model_class, user_name, **kwargs):
     return session.query(model_class).filter_by(username=user_name, **kwargs).one()
 
 
+def find_entry_by_name(model_class, user_name):
+    session = Session()
+    return session.query(model_class).filter_by(username=user_name).first()
+
+
 def update_entry(entry, *, commit=True, **kwargs):
     session = Session()
     for key, value in kwargs.items():
         setattr(entry, key, value)
     if commit:
-        session.commit()
+        save(session)
     return entry
 
 
@@ -51,65 +156,258 @@ def delete_entry(entry, commit=True):
     session = Session()
     session.delete(entry)
     if commit:
-        session.commit()
+        save(session)
     return
 
 
-def get_list_of_classrooms_by_1or2_statuses(request):
+def read_cache_generation(name):
     session = Session()
-    statuses = request['status']
-    q1 = session.query(Classroom).filter_by(classroomStatus=statuses[0]).all()
-    q2 = []
-    if len(statuses) > 1:
-        q2 = session.query(Classroom).filter_by(classroomStatus=statuses[1]).all()
+    return session.query(CacheGeneration.generation).filter_by(name=name).scalar() or 0
+
+
+def bump_cache_generation(name):
+    session = Session()
+    updated = session.query(CacheGeneration) \
+        .filter_by(name=name) \
+        .update({CacheGeneration.generation: CacheGeneration.generation + 1}, synchronize_session=False)
+    if not updated:
+        session.add(CacheGeneration(name=name, generation=1))
 
-    return q1 + q2
 
+def invalidate_classroom(classroomid):
+    """Drop the cached classroom here and, through the generation, in every worker."""
+    bump_cache_generation('classroom')
+    cache.classrooms.invalidate(classroomid)
 
-def get_list_of_orders_by_1or2_statuses(request):
+
+def _classroom_rows():
     session = Session()
-    statuses = request['status']
-    q1 = session.query(Order).filter_by(orderStatus=statuses[0]).all()
-    q2 = []
-    if len(statuses) > 1:
-        q2 = session.query(Order).filter_by(orderStatus=statuses[1]).all()
+    return session.query(Classroom.id, Classroom.name, Classroom.capacity, Classroom.classroomStatus)
+
+
+def _load_classrooms(ids):
+    return {x.id: CachedClassroom(*x) for x in _classroom_rows().filter(Classroom.id.in_(ids))}
+
+
+def warm_classroom_cache(batch_size=1000):
+    """Fill cache.classrooms with up to max_size classrooms, one page per query.
+
+    Returns the number of classrooms loaded.
+    """
+    if not cache.classrooms.enabled:
+        return 0
+
+    cache.classrooms.sync_to(read_cache_generation('classroom'))
+    loaded = 0
+    after = None
+    while loaded < cache.classrooms.max_size:
+        page = paginate(_classroom_rows(), Classroom.id, after, min(batch_size, cache.classrooms.max_size - loaded))
+        cache.classrooms.put_many({x.id: CachedClassroom(*x) for x in page.items})
+        loaded += len(page.items)
+        if page.next_after is None:
+            break
+        after = page.next_after
+    return loaded
+
+
+def get_classrooms(ids):
+    """{id: CachedClassroom} for the existing classrooms among ids."""
+    return cache.classrooms.get_many(list(ids), _load_classrooms, lambda: read_cache_generation('classroom'))
+
+
+def invalidate_user(userid):
+    """Drop the cached user here and, through the generation, in every worker."""
+    bump_cache_generation('user')
+    cache.users.invalidate(userid)
+
+
+def _load_users(ids):
+    session = Session()
+    rows = session.query(User.id, User.username, User.isAdmin, User.password, User.userStatus) \
+        .filter(User.id.in_(ids))
+    return {x.id: CachedUser(*x) for x in rows}
+
+
+def get_cached_user(uid):
+    """CachedUser for uid, or None if there is no such user."""
+    return cache.users.get_many([uid], _load_users, lambda: read_cache_generation('user')).get(uid)
+
+
+def _attach_classrooms(rows, classroom_id, combine, batch_size=1000):
+    # Rows of deleted classrooms are skipped, as an inner join would. Only
+    # for fetched pages: a cache miss while a yield_per stream still holds
+    # the connection's server-side cursor would run a query out of sync.
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return
+        classrooms = get_classrooms({classroom_id(x) for x in chunk})
+        for row in chunk:
+            classroom = classrooms.get(classroom_id(row))
+            if classroom is not None:
+                yield combine(row, classroom)
 
-    return q1 + q2
 
+def classroom_availability(current_time=None, classroomid=Classroom.id):
+    if current_time is None:
+        current_time = datetime.now()
 
-def find_orders_by_userid(userid):
+    is_busy = exists().where(Order.classroomId == classroomid,
+                             Order.orderStatus == 'placed',
+                             Order.start_time <= current_time,
+                             current_time <= Order.end_time,
+                             )
+
+    return case((is_busy, 'unavailable'), else_='available')
+
+
+def query_classrooms(current_time=None):
     session = Session()
-    return session.query(Order).filter_by(userId=userid).all()
+    availability = classroom_availability(current_time)
+    return session.query(Classroom) \
+        .options(with_expression(Classroom.availability, availability)) \
+        .populate_existing()
+
+
+def get_classroom_by_id(uid):
+    return query_classrooms().filter(Classroom.id == uid).one()
 
 
-def find_placed_orders_by_userid(userid):
+def _generation(name):
     session = Session()
-    return session.query(Order).filter_by(userId=userid, orderStatus='placed').all()
+    return func.coalesce(session.query(CacheGeneration.generation).filter_by(name=name).scalar_subquery(), 0)
 
-def reload_classroom_statuses(commit=True):
+
+def booking_signal():
+    """(catalog generation, booking generation), read from cache_generation.
+
+    Together they change with every classroom write and every placed order
+    change made through the handlers, so they key whole-table reads.
+    """
     session = Session()
-    current_time = datetime.now()
+    return tuple(session.query(_generation('classroom'), _generation('booking')).one())
 
-    for classroom_id in Session.scalars(select(Classroom.id)).all():
 
-        classroom = get_entry_by_id(Classroom, classroom_id)
+def classroom_signal(uid, current_time=None):
+    """(catalog generation, bookingVersion, availability now) of one classroom.
 
-        if session.query(exists().where(Order.classroomId == classroom_id,
-                                        Order.orderStatus == 'placed',
-                                        Order.start_time <= current_time,
-                                        current_time <= Order.end_time,
-                                        )).scalar():
+    None if there is no such classroom. One primary key read, so a single
+    classroom's ETag does not follow bookings of the others.
+    """
+    session = Session()
+    return session.query(_generation('classroom'), Classroom.bookingVersion,
+                         classroom_availability(current_time, uid)) \
+        .filter(Classroom.id == uid) \
+        .one_or_none()
 
-            change = {"classroomStatus": "unavailable"}
-        else:
-            change = {"classroomStatus": "available"}
 
-        classroom_data = ClassroomData().load(change)
-        update_entry(classroom, **classroom_data)
+def user_orders_signal(userid):
+    """(catalog generation, orderVersion) for the user's order list."""
+    session = Session()
+    return session.query(_generation('classroom'), User.orderVersion).filter(User.id == userid).one_or_none()
 
-    if commit:
-        session.commit()
-    return
+
+def next_availability_change(signal, current_time=None):
+    """Start of the next placed order and end of the earliest running or next one.
+
+    Availability computed at current_time stays valid until one of them is
+    reached, so the pair is remembered for as long as signal is unchanged.
+    """
+    global _availability_change
+    if current_time is None:
+        current_time = datetime.now()
+
+    with _availability_change_lock:
+        memo = _availability_change
+    if memo is not None and memo[0] == signal and memo[1] <= current_time \
+            and (memo[2] is None or current_time < memo[2]) \
+            and (memo[3] is None or current_time <= memo[3]):
+        return memo[2], memo[3]
+
+    session = Session()
+    next_start = session.query(func.min(Order.start_time)) \
+        .filter(Order.orderStatus == 'placed', Order.start_time > current_time) \
+        .scalar()
+    next_end = session.query(func.min(Order.end_time)) \
+        .filter(Order.orderStatus == 'placed', Order.end_time >= current_time) \
+        .scalar()
+
+    with _availability_change_lock:
+        _availability_change = (signal, current_time, next_start, next_end)
+    return next_start, next_end
+
+
+def get_cached_classroom(uid):
+    """Classroom from the cache with its availability computed now."""
+    session = Session()
+    classroom = get_classrooms([uid]).get(uid)
+    if classroom is None:
+        raise NoResultFound()
+
+    return classroom._replace(availability=session.query(classroom_availability(None, uid)).scalar())
+
+
+def get_list_of_classrooms_by_1or2_statuses(request, after=None, limit=100):
+    session = Session()
+    statuses = request['status']
+    is_available = classroom_availability()
+    if limit is None:
+        # Streams keep the join, see _attach_classrooms.
+        query = session.query(Classroom.id, Classroom.name, Classroom.capacity, Classroom.classroomStatus,
+                              is_available.label('availability')).filter(is_available.in_(statuses))
+        page = paginate(query, Classroom.id, after, limit)
+        return page._replace(items=(CachedClassroom(*x) for x in page.items))
+
+    query = session.query(Classroom.id, is_available.label('availability')).filter(is_available.in_(statuses))
+    page = paginate(query, Classroom.id, after, limit)
+
+    items = _attach_classrooms(page.items, lambda x: x.id,
+                               lambda row, classroom: classroom._replace(availability=row.availability))
+    return page._replace(items=list(items))
+
+
+def find_available_classrooms(start_time, end_time, min_capacity=1, limit=100):
+    """Classrooms with no placed order overlapping the range, smallest fitting first."""
+    is_booked = exists().where(*_overlapping_orders(Classroom.id, start_time, end_time))
+    return query_classrooms() \
+        .filter(Classroom.capacity >= min_capacity, ~is_booked) \
+        .order_by(Classroom.capacity, Classroom.id) \
+        .limit(limit) \
+        .all()
+
+
+def get_list_of_orders_by_1or2_statuses(request, after=None, limit=100):
+    session = Session()
+    statuses = request['status']
+    query = session.query(Order).filter(Order.orderStatus.in_(statuses))
+    return paginate(query, Order.id, after, limit)
+
+
+def find_orders_by_userid(userid, after=None, limit=100):
+    session = Session()
+    query = session.query(Order).filter_by(userId=userid)
+    return paginate(query, Order.id, after, limit)
+
+
+def find_placed_orders_with_classroom_by_userid(userid, after=None, limit=100):
+    session = Session()
+    columns = (Order.id, Order.classroomId, Order.userId, Order.start_time, Order.end_time, Order.orderStatus)
+    if limit is None:
+        # Streams keep the join, see _attach_classrooms.
+        query = session.query(*columns, Classroom.name, Classroom.capacity) \
+            .join(Classroom, Order.classroomId == Classroom.id) \
+            .filter(Order.userId == userid, Order.orderStatus == 'placed')
+        page = paginate(query, Order.id, after, limit)
+        return page._replace(items=(SelfOrder(*x) for x in page.items))
+
+    query = session.query(*columns).filter(Order.userId == userid, Order.orderStatus == 'placed')
+    page = paginate(query, Order.id, after, limit)
+
+    # Classroom name and capacity come from the cache instead of a join.
+    items = _attach_classrooms(page.items, lambda x: x.classroomId,
+                               lambda row, classroom: SelfOrder(*row, classroom.name, classroom.capacity))
+    return page._replace(items=list(items))
 
 
 def create_order(commit=True, **orderinfo):
@@ -124,40 +422,269 @@ def create_order(commit=True, **orderinfo):
     order = Order(**orderinfo, user=user, classroom=classroom)
 
     session.add(order)
+    if order.orderStatus in (None, 'placed'):
+        bump_booking_versions([classroomid], [userid])
+        _update_index_on_commit(session, availability.index.booked, classroomid, order.start_time, order.end_time)
     if commit:
-        session.commit()
+        save(session)
     return order
 
 
+def cancel_order(order, commit=True):
+    session = Session()
+    if order.orderStatus == 'placed':
+        bump_booking_versions([order.classroomId], [order.userId])
+        _update_index_on_commit(session, availability.index.cancelled,
+                                order.classroomId, order.start_time, order.end_time)
+
+    order.orderStatus = 'denied'
+    if commit:
+        save(session)
+    return order
+
+
+def bump_booking_versions(classroom_ids, user_ids):
+    """Mark the placed orders of the classrooms and users as changed.
+
+    bookingVersion tells every worker's index and the classroom ETags,
+    orderVersion the users' order lists and the booking generation the
+    reads over all classrooms.
+    """
+    session = Session()
+    session.query(Classroom) \
+        .filter(Classroom.id.in_(classroom_ids)) \
+        .update({Classroom.bookingVersion: Classroom.bookingVersion + 1}, synchronize_session=False)
+    session.query(User) \
+        .filter(User.id.in_(user_ids)) \
+        .update({User.orderVersion: User.orderVersion + 1}, synchronize_session=False)
+    bump_cache_generation('booking')
+
+
+def _update_index_on_commit(session, change, classroomid, start_time, end_time):
+    """Apply change to the availability index once the transaction commits.
+
+    Called after bump_booking_versions, so the version read here is the one
+    the classroom has when the write commits; a rolled back write leaves the
+    index alone.
+    """
+    if not availability.index.enabled:
+        return
+    version = session.query(Classroom.bookingVersion).filter_by(id=classroomid).scalar()
+    session.info.setdefault("index_updates", []).append((change, classroomid, start_time, end_time, version))
+
+
+@event.listens_for(SessionFactory, "after_commit")
+def _apply_index_updates(session):
+    for change, *args in session.info.pop("index_updates", ()):
+        change(*args)
+
+
+@event.listens_for(SessionFactory, "after_rollback")
+def _discard_index_updates(session):
+    session.info.pop("index_updates", None)
+
+
+def _overlapping_orders(classroomid, start_time, end_time):
+    # Two intervals overlap exactly when each one starts before the other ends,
+    # so a single range predicate on ix_order_booking covers every case.
+    return (Order.classroomId == classroomid,
+            Order.orderStatus == 'placed',
+            Order.start_time < end_time,
+            Order.end_time > start_time,
+            )
+
+
 def is_classroom_free_in_range(classroomid, start_time, end_time):
     session = Session()
+    if availability.index.enabled:
+        # One primary key read instead of the range query; the index is
+        # rebuilt only when another worker changed the classroom's orders.
+        version = session.query(Classroom.bookingVersion).filter_by(id=classroomid).scalar()
+        if version is not None:
+            placed = session.query(Order.start_time, Order.end_time) \
+                .filter_by(classroomId=classroomid, orderStatus='placed')
+            return availability.index.is_free(classroomid, start_time, end_time, version, placed.all)
+
+    return not session.query(exists().where(*_overlapping_orders(classroomid, start_time, end_time))).scalar()
+
+
+def find_booked_intervals(classroomid, start_time, end_time):
+    """Placed orders of the classroom overlapping the range, sorted by start."""
+    session = Session()
+    return session.query(Order.id, Order.start_time, Order.end_time) \
+        .filter(*_overlapping_orders(classroomid, start_time, end_time)) \
+        .order_by(Order.start_time) \
+        .all()
+
+
+def book_classroom(**orderinfo):
+    """Atomically check the range and place the order.
+
+    The classroom row is locked FOR UPDATE and the overlap check is a locking
+    read, so concurrent bookings of the same classroom are serialized until
+    commit. Returns None when the range is already taken.
+    """
+    session = Session()
+    classroomid = orderinfo.get('classroomId')
+
+    # Requests for taken slots of hot classrooms are turned away without
+    # queueing on the locks; the locking check below stays authoritative.
+    if availability.index.enabled \
+            and not is_classroom_free_in_range(classroomid, orderinfo.get('start_time'), orderinfo.get('end_time')):
+        return None
+
+    with _booking_locks[classroomid % len(_booking_locks)]:
+        session.query(Classroom.id).filter_by(id=classroomid).with_for_update().one()
+
+        conflict = session.query(Order.id) \
+            .filter(*_overlapping_orders(classroomid, orderinfo.get('start_time'), orderinfo.get('end_time'))) \
+            .with_for_update() \
+            .first()
+
+        if conflict is not None:
+            session.rollback()
+            return None
+
+        # Committed right away even inside a unit of work, so the row lock
+        # and the striped lock are released together.
+        order = create_order(commit=False, **orderinfo)
+        session.commit()
+        return order
+
+
+def book_classrooms_batch(userid, bookings, partial=False):
+    """Place many orders with one conflict query and one multi-row INSERT.
+
+    bookings are dicts with classroomId, start_time and end_time. They are
+    checked against placed orders and against each other in input order.
+    Returns ({index: order row}, {index: error}); without partial nothing
+    is inserted unless every booking fits.
+    """
+    session = Session()
+    classroom_ids = sorted({x['classroomId'] for x in bookings})
+    stripes = sorted({x % len(_booking_locks) for x in classroom_ids})
+
+    for stripe in stripes:
+        _booking_locks[stripe].acquire()
+    try:
+        # Row locks in id order so concurrent batches cannot deadlock.
+        found = {x.id for x in session.query(Classroom.id)
+                 .filter(Classroom.id.in_(classroom_ids))
+                 .order_by(Classroom.id)
+                 .with_for_update()}
+
+        window_start = min(x['start_time'] for x in bookings)
+        window_end = max(x['end_time'] for x in bookings)
+        busy = defaultdict(IntervalSet)
+        existing = session.query(Order.classroomId, Order.start_time, Order.end_time) \
+            .filter(Order.classroomId.in_(classroom_ids),
+                    Order.orderStatus == 'placed',
+                    Order.start_time < window_end,
+                    Order.end_time > window_start) \
+            .order_by(Order.classroomId, Order.start_time) \
+            .with_for_update()
+        for row in existing:
+            busy[row.classroomId].add(row.start_time, row.end_time)
+
+        accepted = []
+        errors = {}
+        for index, booking in enumerate(bookings):
+            classroomid = booking['classroomId']
+            if classroomid not in found:
+                errors[index] = "Classroom with entered id does not found"
+            elif busy[classroomid].overlaps(booking['start_time'], booking['end_time']):
+                errors[index] = "This classroom will be unavailable in entered period of time"
+            else:
+                busy[classroomid].add(booking['start_time'], booking['end_time'])
+                accepted.append(index)
+
+        if not accepted or (errors and not partial):
+            session.rollback()
+            return {}, errors
+
+        session.execute(insert(Order), [{"userId": userid,
+                                         "classroomId": bookings[i]['classroomId'],
+                                         "start_time": bookings[i]['start_time'],
+                                         "end_time": bookings[i]['end_time'],
+                                         "orderStatus": 'placed'} for i in accepted])
+        booked_ids = {bookings[i]['classroomId'] for i in accepted}
+        bump_booking_versions(booked_ids, [userid])
+        availability.index.invalidate(booked_ids)
+
+        # A placed order is identified by classroom and start time, since
+        # orders of one classroom never overlap.
+        rows = session.query(Order.id, Order.classroomId, Order.userId,
+                             Order.start_time, Order.end_time, Order.orderStatus) \
+            .filter(Order.userId == userid,
+                    Order.orderStatus == 'placed',
+                    Order.classroomId.in_(booked_ids),
+                    Order.start_time.in_({bookings[i]['start_time'] for i in accepted})) \
+            .all()
+        by_slot = {(x.classroomId, x.start_time): x for x in rows}
+        session.commit()
+
+        placed = {i: by_slot[(bookings[i]['classroomId'], bookings[i]['start_time'])] for i in accepted}
+        return placed, errors
+    finally:
+        for stripe in stripes:
+            _booking_locks[stripe].release()
+
 
-    if session.query(exists().where(Order.classroomId == classroomid,
-                                    Order.orderStatus == 'placed',
-                                    Order.start_time <= start_time,
-                                    start_time < Order.end_time
-                                    )).scalar():
-        return False
-
-    if session.query(exists().where(Order.classroomId == classroomid,
-                                    Order.orderStatus == 'placed',
-                                    Order.start_time < end_time,
-                                    end_time <= Order.end_time
-                                    )).scalar():
-        return False
-
-    if session.query(exists().where(Order.classroomId == classroomid,
-                                    Order.orderStatus == 'placed',
-                                    start_time <= Order.start_time,
-                                    Order.start_time < end_time
-                                    )).scalar():
-        return False
-
-    if session.query(exists().where(Order.classroomId == classroomid,
-                                    Order.orderStatus == 'placed',
-                                    start_time < Order.end_time,
-                                    Order.end_time <= end_time
-                                    )).scalar():
-        return False
-
-    return True
+def book_series(userid, classroomid, occurrences):
+    """Place every occurrence of a recurring booking or none of them.
+
+    Placed orders of the classroom over the whole span are loaded with one
+    query and every occurrence is tested against them by bisection. Returns
+    (orders, conflicts): the new orders sharing one seriesId, or no orders
+    and the (start, end) occurrences that are already taken.
+    """
+    session = Session()
+
+    with _booking_locks[classroomid % len(_booking_locks)]:
+        session.query(Classroom.id).filter_by(id=classroomid).with_for_update().one()
+
+        busy = IntervalSet((x.start_time, x.end_time) for x in session.query(Order.start_time, Order.end_time)
+                           .filter(*_overlapping_orders(classroomid, occurrences[0][0], occurrences[-1][1]))
+                           .with_for_update())
+
+        conflicts = [occurrences[i] for i in busy.overlapping(occurrences)]
+        if conflicts:
+            session.rollback()
+            return [], conflicts
+
+        series_id = uuid.uuid4().hex
+        session.execute(insert(Order), [{"userId": userid,
+                                         "classroomId": classroomid,
+                                         "start_time": start_time,
+                                         "end_time": end_time,
+                                         "orderStatus": 'placed',
+                                         "seriesId": series_id} for start_time, end_time in occurrences])
+        bump_booking_versions([classroomid], [userid])
+        availability.index.invalidate([classroomid])
+        session.commit()
+        # Loaded after the commit, which would expire them row by row.
+        return find_series_orders(series_id), []
+
+
+def find_series_orders(series_id):
+    session = Session()
+    return session.query(Order).filter_by(seriesId=series_id).order_by(Order.start_time).all()
+
+
+def cancel_series(series_id, current_time=None):
+    """Deny the placed occurrences of the series that have not ended yet."""
+    if current_time is None:
+        current_time = datetime.now()
+
+    session = Session()
+    classroomid, userid = session.query(Order.classroomId, Order.userId).filter_by(seriesId=series_id).first() or (None, None)
+    cancelled = session.query(Order) \
+        .filter(Order.seriesId == series_id,
+                Order.orderStatus == 'placed',
+                Order.end_time > current_time) \
+        .update({Order.orderStatus: 'denied'}, synchronize_session='fetch')
+    if cancelled:
+        bump_booking_versions([classroomid], [userid])
+        availability.index.invalidate([classroomid])
+    save(session)
+    return cancelled
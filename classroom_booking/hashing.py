@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+from flask_bcrypt import generate_password_hash
+
+from classroom_booking import metrics
+from classroom_booking.config import Config
+
+
+class HashingUnavailable(Exception):
+    """No room left in the hashing queue, or the pool did not answer in time."""
+
+
+def _hash(password, rounds):
+    # Runs in a pool process, module level so it pickles by reference.
+    return generate_password_hash(password, rounds).decode("utf-8")
+
+
+class HashPool:
+    """bcrypt hashing in a lazily started pool of processes.
+
+    bcrypt is CPU bound, in the request thread it keeps a worker (and with
+    threaded workers every other request of the process) busy for the whole
+    work factor. At most queue_limit hashes are queued or running per
+    process; past that hash() fails fast with HashingUnavailable instead of
+    piling requests up behind a registration burst. workers=0 hashes in the
+    calling thread, still bounded by queue_limit.
+    """
+
+    def __init__(self, workers=2, queue_limit=16, rounds=12, timeout=30, bulk_workers=2):
+        self.workers = workers
+        self.bulk_workers = bulk_workers
+        self.rounds = rounds
+        self.timeout = timeout
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, forking a threaded worker process is not safe.
+                self._executor = ProcessPoolExecutor(self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise HashingUnavailable("Too many password hashes in progress")
+            self.in_flight += 1
+
+    def _release(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def _slot(self):
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def hash(self, password):
+        if self.workers <= 0:
+            with self._slot():
+                return _hash(password, self.rounds)
+
+        self._acquire()
+        try:
+            future = self._pool().submit(_hash, password, self.rounds)
+        except BrokenProcessPool:
+            self._release()
+            self.shutdown(wait=False)
+            raise HashingUnavailable("Password hashing pool crashed")
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the job is done, not only while this request
+        # waits for it, so timed out jobs still count against queue_limit.
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except BrokenProcessPool:
+            self.shutdown(wait=False)
+            raise HashingUnavailable("Password hashing pool crashed")
+        except TimeoutError:
+            future.cancel()
+            raise HashingUnavailable("Password hashing timed out")
+
+    def hash_many(self, passwords, workers=0, timeout=None):
+        """Hash a bulk import on `workers` processes, 0 means bulk_workers.
+
+        The whole call takes one queue slot. Its processes are started for
+        the call, so they neither hold memory between imports nor take the
+        pool serving single requests. After timeout seconds the queued hashes
+        are cancelled; the slot is kept until the running ones are done.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return []
+        if self.workers <= 0:
+            with self._slot():
+                return [_hash(password, self.rounds) for password in passwords]
+
+        self._acquire()
+        executor = ProcessPoolExecutor(min(workers or self.bulk_workers or 1, len(passwords)),
+                                       mp_context=multiprocessing.get_context("spawn"))
+        try:
+            hashes = list(executor.map(_hash, passwords, repeat(self.rounds), timeout=timeout))
+        except BrokenProcessPool:
+            self._abandon(executor)
+            raise HashingUnavailable("Password hashing pool crashed")
+        except TimeoutError:
+            self._abandon(executor)
+            raise HashingUnavailable("Password hashing timed out")
+        except BaseException:
+            self._abandon(executor)
+            raise
+
+        self._finish(executor)
+        return hashes
+
+    def _finish(self, executor):
+        executor.shutdown(wait=True, cancel_futures=True)
+        self._release()
+
+    def _abandon(self, executor):
+        threading.Thread(target=self._finish, args=(executor,), daemon=True).start()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def reset_after_fork(self):
+        # The executor's processes and threads belong to the parent.
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+
+
+pool = HashPool(Config.HASH_POOL_WORKERS, Config.HASH_QUEUE_LIMIT, Config.BCRYPT_ROUNDS,
+                Config.HASH_TIMEOUT, Config.HASH_BULK_WORKERS)
+
+
+def hash_password(password):
+    with metrics.timed("bcrypt"):
+        return pool.hash(password)
+
+
+def hash_passwords(passwords, workers=0, timeout=None):
+    with metrics.timed("bcrypt"):
+        return pool.hash_many(passwords, workers, timeout)
+
+
+def configure(config):
+    pool.shutdown(wait=False)
+    pool.workers = config.HASH_POOL_WORKERS
+    pool.rounds = config.BCRYPT_ROUNDS
+    pool.timeout = config.HASH_TIMEOUT
+    pool.bulk_workers = config.HASH_BULK_WORKERS
+    pool.queue_limit = config.HASH_QUEUE_LIMIT
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=pool.reset_after_fork)
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, request, has_app_context
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Spans added to Server-Timing and exported as <name>_seconds_total.
+SPANS = {
+    "db": "Time spent executing SQL statements.",
+    "bcrypt": "Time spent hashing and checking passwords.",
+    "serialize": "Time spent dumping and encoding response bodies.",
+}
+
+
+class Timings:
+    """What one request spent its time on, kept in g.timings."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.spans = defaultdict(float)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.latency = 0.0
+        self.statuses = defaultdict(int)
+        self.queries = 0
+        self.spans = defaultdict(float)
+
+    def record(self, status, elapsed, timings):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.latency += elapsed
+        self.statuses[status] += 1
+        self.queries += timings.queries
+        for name, spent in timings.spans.items():
+            self.spans[name] += spent
+
+
+# Per process, like pool_stats(); scrape every worker or aggregate upstream.
+_endpoints = defaultdict(EndpointStats)
+_lock = threading.Lock()
+
+
+def current_timings():
+    if has_app_context():
+        return g.get("timings")
+    return None
+
+
+@contextmanager
+def timed(span):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings()
+        if timings is not None:
+            timings.spans[span] += time.perf_counter() - started
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings.queries += 1
+        timings.spans["db"] += elapsed
+
+
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+def start_request():
+    g.timings = Timings()
+
+
+def finish_request(response):
+    timings = g.get("timings")
+    if timings is None:
+        return response
+
+    endpoint = request.endpoint or "unmatched"
+    if response.is_streamed:
+        # The body is produced after this hook, inside the request's context,
+        # so its queries and serialization still add up in g.timings. The
+        # request is recorded once the server closes the response.
+        response.call_on_close(lambda: record(endpoint, response.status_code, timings))
+    else:
+        g.pop("timings")
+        record(endpoint, response.status_code, timings)
+
+    # For a stream, this covers the time until the headers are sent.
+    response.headers["Server-Timing"] = server_timing(time.perf_counter() - timings.started, timings)
+    return response
+
+
+def record(endpoint, status, timings):
+    elapsed = time.perf_counter() - timings.started
+    with _lock:
+        _endpoints[endpoint].record(status, elapsed, timings)
+
+
+def server_timing(elapsed, timings):
+    entries = [f"app;dur={elapsed * 1000:.2f}",
+               f'db;dur={timings.spans["db"] * 1000:.2f};desc="{timings.queries} queries"']
+    entries += [f"{name};dur={timings.spans[name] * 1000:.2f}" for name in SPANS
+                if name != "db" and name in timings.spans]
+    return ", ".join(entries)
+
+
+def init_app(app):
+    """Time every request of the app.
+
+    Call before registering the blueprints: after_request hooks run in
+    reverse order, so the unit of work commit is timed as well.
+    """
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+
+def render():
+    """All endpoint statistics in the Prometheus text exposition format."""
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        lines = ["# HELP http_request_duration_seconds Request latency by endpoint.",
+                 "# TYPE http_request_duration_seconds histogram"]
+        for endpoint, stats in endpoints:
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {stats.count}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {stats.latency:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {stats.count}')
+
+        lines += ["# HELP http_requests_total Requests by endpoint and status code.",
+                  "# TYPE http_requests_total counter"]
+        for endpoint, stats in endpoints:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+        lines += ["# HELP db_queries_total SQL statements executed by endpoint.",
+                  "# TYPE db_queries_total counter"]
+        for endpoint, stats in endpoints:
+            lines.append(f'db_queries_total{{endpoint="{endpoint}"}} {stats.queries}')
+
+        for name, description in SPANS.items():
+            lines += [f"# HELP {name}_seconds_total {description}",
+                      f"# TYPE {name}_seconds_total counter"]
+            for endpoint, stats in endpoints:
+                lines.append(f'{name}_seconds_total{{endpoint="{endpoint}"}} {stats.spans[name]:.6f}')
+
+    return "\n".join(lines) + "\n"
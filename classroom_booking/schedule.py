@@ -0,0 +1,118 @@
+from bisect import bisect_left, bisect_right
+
+
+def expand_recurrence(start_time, end_time, step, until):
+    """Occurrences of the (start_time, end_time) slot every `step` while they start by `until`."""
+    occurrences = []
+    while start_time <= until:
+        occurrences.append((start_time, end_time))
+        start_time += step
+        end_time += step
+    return occurrences
+
+
+def merge_intervals(intervals):
+    """Merge (start, end) pairs sorted by start into disjoint busy blocks.
+
+    Overlapping and touching intervals are joined in a single pass.
+    """
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def free_gaps(intervals, window_start, window_end):
+    """Free (start, end) gaps inside the window between intervals sorted by start."""
+    gaps = []
+    cursor = window_start
+    for start, end in merge_intervals(intervals):
+        if start > cursor:
+            gaps.append((cursor, min(start, window_end)))
+        cursor = max(cursor, end)
+        if cursor >= window_end:
+            break
+    if cursor < window_end:
+        gaps.append((cursor, window_end))
+    return gaps
+
+
+class IntervalSet:
+    """Disjoint busy intervals kept sorted for O(log n) overlap checks."""
+
+    def __init__(self, intervals=()):
+        merged = merge_intervals(sorted(intervals))
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        # The only candidate is the last interval starting before `end`.
+        i = bisect_left(self.starts, end) - 1
+        return i >= 0 and self.ends[i] > start
+
+    def overlapping(self, intervals):
+        """Indices of the intervals that overlap the set, one bisection each."""
+        return [i for i, (start, end) in enumerate(intervals) if self.overlaps(start, end)]
+
+    def add(self, start, end):
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+
+class OrderIntervals:
+    """Intervals sorted by start that may touch or overlap, with removal.
+
+    reach[i] is the latest end among the first i + 1 intervals, so an overlap
+    check stays one bisection even if stored intervals overlap each other.
+    """
+
+    def __init__(self, intervals=()):
+        pairs = sorted(intervals)
+        self.starts = [start for start, _ in pairs]
+        self.ends = [end for _, end in pairs]
+        self.reach = []
+        self._update_reach(0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _update_reach(self, i):
+        del self.reach[i:]
+        latest = self.reach[-1] if self.reach else None
+        for end in self.ends[i:]:
+            if latest is None or end > latest:
+                latest = end
+            self.reach.append(latest)
+
+    def overlaps(self, start, end):
+        i = bisect_left(self.starts, end) - 1
+        return i >= 0 and self.reach[i] > start
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self._update_reach(i)
+
+    def remove(self, start, end):
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ends[i] == end:
+                del self.starts[i]
+                del self.ends[i]
+                self._update_reach(i)
+                return True
+            i += 1
+        return False
@@ -1,6 +1,31 @@
-from flask_bcrypt import generate_password_hash
-from marshmallow import validate, Schema, fields
-from datetime import date, datetime
+import base64
+import binascii
+import os
+
+from marshmallow import validate, Schema, fields, ValidationError, EXCLUDE, validates_schema
+from datetime import date, datetime, timedelta
+
+from classroom_booking.hashing import hash_password
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_SCHEDULE_DAYS = 31
+MAX_BATCH_SIZE = 5000
+MAX_SERIES_OCCURRENCES = 366
+
+# Set COMPILED_DUMPS=0 to serialize through plain marshmallow again.
+COMPILED_DUMPS = os.environ.get("COMPILED_DUMPS", "1") != "0"
+
+
+def encode_cursor(after):
+    return base64.urlsafe_b64encode(str(after).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError("Invalid cursor.")
 
 
 class CreateUser(Schema):
@@ -8,11 +33,25 @@ class CreateUser(Schema):
     firstName = fields.String(required=True, validate=validate.Length(min=2))
     lastName = fields.String(required=True, validate=validate.Length(min=2))
     email = fields.String(required=True, validate=validate.Email())
-    password = fields.Function(required=True, deserialize=lambda obj: generate_password_hash(obj), load_only=True)
+    password = fields.Function(required=True, deserialize=hash_password, load_only=True)
     phone = fields.Function(validate=validate.Regexp('^[+]*[(]{0,1}[0-9]{1,4}[)]{0,1}[\s0-9]{4,20}$'))
     birthDate = fields.Date(validate=lambda x: x < date.today())
 
 
+class BulkUser(CreateUser):
+    # Plain password, classroom_booking.user_import hashes the accepted rows
+    # together once usernames are checked.
+    password = fields.String(required=True, load_only=True)
+
+
+class BulkUsers(Schema):
+    # Rows are validated one by one with BulkUser so that partial mode can
+    # report them individually. POST /user/bulk caps their number with
+    # BULK_USERS_MAX_ROWS, import_users.py takes any number.
+    users = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1))
+    mode = fields.String(load_default="all_or_nothing", validate=validate.OneOf(["all_or_nothing", "partial"]))
+
+
 class UserData(Schema):
     id = fields.Integer()
     username = fields.String()
@@ -28,7 +67,7 @@ class UpdateUser(Schema):
     firstName = fields.String(validate=validate.Length(min=2))
     lastName = fields.String(validate=validate.Length(min=2))
     email = fields.String(validate=validate.Email())
-    password = fields.Function(deserialize=lambda obj: generate_password_hash(obj), load_only=True)
+    password = fields.Function(deserialize=hash_password, load_only=True)
     phone = fields.Function(validate=validate.Regexp('^[+]*[(]{0,1}[0-9]{1,4}[)]{0,1}[\s0-9]{4,20}$'))
 
 
@@ -46,7 +85,7 @@ class GetUser(Schema):
 class ClassroomData(Schema):
     id = fields.Integer()
     name = fields.String()
-    classroomStatus = fields.String()
+    classroomStatus = fields.Function(lambda obj: obj.availability or obj.classroomStatus)
     capacity = fields.Integer()
 
 
@@ -69,9 +108,172 @@ class OrderData(Schema):
     orderStatus = fields.String()
 
 
+class SelfOrderData(Schema):
+    id = fields.Integer()
+    classroomId = fields.Integer()
+    userId = fields.Integer()
+    start_time = fields.DateTime(format="%Y-%m-%d %H:%M:%S")
+    end_time = fields.DateTime(format="%Y-%m-%d %H:%M:%S")
+    orderStatus = fields.String()
+    classroom_name = fields.String()
+    classroom_capacity = fields.Integer()
+
+
 class PlaceOrder(Schema):
     classroomId = fields.Integer(required=True)
     userId = fields.Integer(required=True)
     start_time = fields.DateTime(required=True, validate=lambda x: x >= datetime.now())
     end_time = fields.DateTime(required=True, validate=lambda x: x >= datetime.now())
 
+
+class BatchOrders(Schema):
+    # Items are validated one by one with PlaceOrder so that partial mode can
+    # report them individually.
+    orders = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1, max=MAX_BATCH_SIZE))
+    mode = fields.String(load_default="all_or_nothing", validate=validate.OneOf(["all_or_nothing", "partial"]))
+
+
+class RecurringOrder(Schema):
+    """First occurrence of the slot, repeated every `interval` days or weeks up to `until`."""
+    classroomId = fields.Integer(required=True)
+    start_time = fields.DateTime(required=True, validate=lambda x: x >= datetime.now())
+    end_time = fields.DateTime(required=True, validate=lambda x: x >= datetime.now())
+    frequency = fields.String(load_default="weekly", validate=validate.OneOf(["daily", "weekly"]))
+    interval = fields.Integer(load_default=1, validate=validate.Range(min=1))
+    until = fields.DateTime(required=True)
+
+    @validates_schema
+    def validate_recurrence(self, data, **kwargs):
+        if data["until"] < data["start_time"]:
+            raise ValidationError("Until must not be earlier than Start time", "until")
+
+        step = timedelta(days=data["interval"] * (7 if data["frequency"] == "weekly" else 1))
+        if (data["until"] - data["start_time"]) // step >= MAX_SERIES_OCCURRENCES:
+            raise ValidationError(f"Series can have at most {MAX_SERIES_OCCURRENCES} occurrences", "until")
+
+        if data["end_time"] - data["start_time"] > step:
+            raise ValidationError("Booking must not be longer than the repeat interval, occurrences would overlap",
+                                  "end_time")
+
+        data["step"] = step
+
+
+class PageParams(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    limit = fields.Integer(load_default=DEFAULT_PAGE_SIZE, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    after = fields.Function(deserialize=decode_cursor, load_default=None)
+
+
+class AvailableClassroomsParams(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    start = fields.DateTime(required=True)
+    end = fields.DateTime(required=True)
+    min_capacity = fields.Integer(load_default=1, validate=validate.Range(min=1))
+    limit = fields.Integer(load_default=DEFAULT_PAGE_SIZE, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        if data["start"] >= data["end"]:
+            raise ValidationError("Start time must be earlier than End time", "end")
+
+
+class ScheduleParams(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    start = fields.DateTime(required=True, data_key="from")
+    end = fields.DateTime(required=True, data_key="to")
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        if data["start"] >= data["end"]:
+            raise ValidationError("Start time must be earlier than End time", "to")
+        if data["end"] - data["start"] > timedelta(days=MAX_SCHEDULE_DAYS):
+            raise ValidationError(f"Schedule can span at most {MAX_SCHEDULE_DAYS} days", "to")
+
+
+def _optional(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+def _compile_field(field):
+    """Return a converter for the field value, or None if it is not supported."""
+    if type(field) is fields.Integer and not field.as_string:
+        return _optional(int)
+    if type(field) is fields.String:
+        return _optional(str)
+    if type(field) is fields.Date and field.format in (None, "iso"):
+        return _optional(date.isoformat)
+    if type(field) is fields.DateTime and field.format in (None, "iso"):
+        return _optional(datetime.isoformat)
+    if type(field) is fields.DateTime and "%" in (field.format or ""):
+        return _optional(lambda value, fmt=field.format: value.strftime(fmt))
+    return None
+
+
+def compile_dump(schema):
+    """Build a function equivalent to schema.dump for the read models.
+
+    The generated code reads every attribute and converts it directly,
+    without marshmallow's per-field dispatch. Schemas with fields it does not
+    understand get schema.dump back unchanged.
+    """
+    if not COMPILED_DUMPS:
+        return schema.dump
+
+    namespace = {}
+    items = []
+    for i, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key or name
+        if type(field) is fields.Function and field.serialize_func is not None:
+            namespace[f"_f{i}"] = field.serialize_func
+            items.append(f"{key!r}: _f{i}(obj)")
+            continue
+
+        convert = _compile_field(field)
+        attribute = field.attribute or name
+        if convert is None or not attribute.isidentifier():
+            return schema.dump
+        namespace[f"_f{i}"] = convert
+        items.append(f"{key!r}: _f{i}(obj.{attribute})")
+
+    source = (
+        "def dump_one(obj):\n"
+        f"    return {{{', '.join(items)}}}\n"
+        "def dump(obj, *, many=False):\n"
+        "    if many:\n"
+        "        return [dump_one(x) for x in obj]\n"
+        "    return dump_one(obj)\n"
+    )
+    exec(source, namespace)
+    return namespace["dump"]
+
+
+create_user_schema = CreateUser()
+update_user_schema = UpdateUser()
+bulk_user_schema = BulkUser()
+bulk_users_schema = BulkUsers()
+create_classroom_schema = CreateClassroom()
+update_classroom_schema = UpdateClassroom()
+place_order_schema = PlaceOrder()
+batch_orders_schema = BatchOrders()
+recurring_order_schema = RecurringOrder()
+page_params_schema = PageParams()
+available_classrooms_params_schema = AvailableClassroomsParams()
+schedule_params_schema = ScheduleParams()
+
+user_data_schema = UserData()
+get_user_schema = GetUser()
+classroom_data_schema = ClassroomData()
+order_data_schema = OrderData()
+self_order_data_schema = SelfOrderData()
+
+dump_user_data = compile_dump(user_data_schema)
+dump_get_user = compile_dump(get_user_schema)
+dump_classroom_data = compile_dump(classroom_data_schema)
+dump_order_data = compile_dump(order_data_schema)
+dump_self_order_data = compile_dump(self_order_data_schema)
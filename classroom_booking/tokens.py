@@ -0,0 +1,48 @@
+import hashlib
+import threading
+import time
+
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+TOKEN_SALT = "classroom-booking-session"
+
+# user id -> unix time before which every issued token is rejected
+_revoked_before = {}
+_revoked_lock = threading.Lock()
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt=TOKEN_SALT)
+
+
+def password_fingerprint(user):
+    return hashlib.sha256(f"{user.password}:{user.userStatus}".encode()).hexdigest()[:16]
+
+
+def issue_token(user):
+    payload = {"id": user.id, "username": user.username, "fp": password_fingerprint(user), "iat": time.time()}
+    return _serializer().dumps(payload)
+
+
+def verify_token(token):
+    """Return the token payload, or None if it is forged, expired or revoked.
+
+    Only the HMAC signature and the in-process revocation list are checked,
+    no database access is needed. Callers compare payload["fp"] with
+    password_fingerprint() of the user, as cached in cache.users.
+    """
+    try:
+        payload = _serializer().loads(token, max_age=current_app.config["TOKEN_TTL"])
+    except (BadSignature, SignatureExpired):
+        return None
+
+    if payload["iat"] <= _revoked_before.get(payload["id"], 0):
+        return None
+
+    return payload
+
+
+def revoke_tokens(user_id):
+    with _revoked_lock:
+        _revoked_before[user_id] = time.time()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+
+from marshmallow import ValidationError
+
+from classroom_booking import db_utils, hashing
+from classroom_booking.schemas import bulk_user_schema
+
+NOT_CREATED = "Not created because another row failed"
+
+
+def read_csv(text):
+    """Rows of CSV text whose header names CreateUser fields, empty cells left out."""
+    return [{key: value for key, value in row.items() if key and value not in (None, "")}
+            for row in csv.DictReader(io.StringIO(text))]
+
+
+def read_json(text):
+    """Rows of a JSON list, or of the "users" list of a bulk request body."""
+    data = json.loads(text)
+    return data["users"] if isinstance(data, dict) else data
+
+
+def import_users(rows, partial=False, batch_size=1000, workers=0, timeout=None):
+    """Create users from rows of CreateUser fields.
+
+    Rows are validated first, usernames checked with one query (against the
+    database and earlier rows), then the accepted passwords are hashed on
+    `workers` processes within timeout seconds and the users inserted in
+    batches. Returns ({index: (id, username)}, {index: error}); without
+    partial nothing is created unless every row is accepted.
+    """
+    users = {}
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            users[index] = bulk_user_schema.load(row)
+        except ValidationError as error:
+            errors[index] = str(error.args[0])
+
+    taken = db_utils.taken_usernames({x["username"] for x in users.values()})
+    first_row = {}
+    for index, user in list(users.items()):
+        username = user["username"]
+        if username in taken:
+            errors[index] = "User with entered username already exists"
+        elif username in first_row:
+            errors[index] = f"Username is already used by row {first_row[username]}"
+        else:
+            first_row[username] = index
+            continue
+        del users[index]
+
+    if not users or (errors and not partial):
+        return {}, errors
+
+    hashes = hashing.hash_passwords([x["password"] for x in users.values()], workers, timeout)
+    for user, password_hash in zip(users.values(), hashes):
+        user["password"] = password_hash
+
+    ids = db_utils.create_users(list(users.values()), batch_size)
+    return {index: (ids[user["username"]], user["username"]) for index, user in users.items()}, errors
+
+
+def results(count, created, errors):
+    """Per-row outcome in input order, as reported by POST /user/bulk."""
+    rows = []
+    for index in range(count):
+        if index in created:
+            rows.append({"index": index, "status": "created", "id": created[index][0],
+                         "username": created[index][1]})
+        else:
+            rows.append({"index": index, "status": "rejected", "error": errors.get(index, NOT_CREATED)})
+    return rows
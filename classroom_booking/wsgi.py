@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers, e.g.
+
+    gunicorn -c gunicorn.conf.py classroom_booking.wsgi:app
+
+classroom_booking.app builds the application on import, reuse it.
+"""
+from classroom_booking.app import app
@@ -0,0 +1,125 @@
+"""Seed the configured database (DB_URL) with synthetic users, classrooms and orders.
+
+Usage: python generate_data.py [--users N] [--classrooms N] [--orders N] [--create-tables] ...
+
+Rows go in through multi-row Core inserts of --batch-size rows, committed
+every --commit-every rows so a large run neither piles up undo in one
+transaction nor loses everything on a failure. Orders are generated lazily
+so 10M of them fit in memory. Every user shares one
+password hash (bcrypt per user would dominate the run), the first --admins
+users are admins. Orders of one classroom never overlap: order k takes
+slot k // classrooms of classroom k % classrooms, slots are 2 hours apart
+starting at --start. Meant for an empty database, usernames are
+<prefix><n> counting from 1.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from flask_bcrypt import generate_password_hash
+from sqlalchemy import insert, select
+
+from classroom_booking.models import BaseModel, User, Classroom, Order, engine
+
+SLOT = timedelta(hours=2)
+
+
+def insert_batches(connection, model, rows, batch_size, commit_every=50000):
+    rows = iter(rows)
+    inserted = 0
+    while True:
+        with connection.begin():
+            pending = 0
+            while pending < commit_every:
+                batch = list(islice(rows, min(batch_size, commit_every - pending)))
+                if not batch:
+                    return inserted
+                connection.execute(insert(model), batch)
+                pending += len(batch)
+                inserted += len(batch)
+
+
+def seed_users(connection, count, password, admins=1, prefix="user", rounds=12, batch_size=10000,
+               commit_every=50000):
+    password_hash = generate_password_hash(password, rounds).decode("utf-8")
+    rows = ({"username": f"{prefix}{n}",
+             "firstName": "Synthetic",
+             "lastName": f"User{n}",
+             "email": f"{prefix}{n}@example.com",
+             "password": password_hash,
+             "phone": f"+38096{n % 10000000:07d}",
+             "birthDate": date(1990, 1, 1) + timedelta(days=n % 7000),
+             "userStatus": '1',
+             "isAdmin": '1' if n <= admins else '0'} for n in range(1, count + 1))
+    return insert_batches(connection, User, rows, batch_size, commit_every)
+
+
+def seed_classrooms(connection, count, prefix="room", batch_size=10000, commit_every=50000):
+    rows = ({"name": f"{prefix}{n}", "capacity": 10 + n % 191} for n in range(1, count + 1))
+    return insert_batches(connection, Classroom, rows, batch_size, commit_every)
+
+
+def seed_orders(connection, count, start, denied_ratio=0.1, seed=0, batch_size=10000, commit_every=50000):
+    user_ids = connection.execute(select(User.id)).scalars().all()
+    classroom_ids = connection.execute(select(Classroom.id).order_by(Classroom.id)).scalars().all()
+    if not user_ids or not classroom_ids:
+        raise SystemExit("orders need at least one user and one classroom")
+
+    rnd = random.Random(seed)
+    rows = ({"classroomId": classroom_ids[k % len(classroom_ids)],
+             "userId": rnd.choice(user_ids),
+             "start_time": start + SLOT * (k // len(classroom_ids)),
+             "end_time": start + SLOT * (k // len(classroom_ids)) + timedelta(hours=1),
+             "orderStatus": 'denied' if rnd.random() < denied_ratio else 'placed'} for k in range(count))
+    return insert_batches(connection, Order, rows, batch_size, commit_every)
+
+
+def generate(users=1000, classrooms=100, orders=10000, password="password", admins=1, rounds=12,
+             start=None, denied_ratio=0.1, seed=0, batch_size=10000, create_tables=False, db_engine=engine,
+             commit_every=50000):
+    if start is None:
+        start = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=30)
+    if create_tables:
+        BaseModel.metadata.create_all(db_engine)
+
+    counts = {}
+    for name, step in (("users", lambda c: seed_users(c, users, password, admins, rounds=rounds,
+                                                      batch_size=batch_size, commit_every=commit_every)),
+                       ("classrooms", lambda c: seed_classrooms(c, classrooms, batch_size=batch_size,
+                                                                commit_every=commit_every)),
+                       ("orders", lambda c: seed_orders(c, orders, start, denied_ratio, seed, batch_size,
+                                                        commit_every))):
+        began = time.perf_counter()
+        with db_engine.connect() as connection:
+            counts[name] = step(connection)
+        elapsed = time.perf_counter() - began
+        print(f"{name:10} {counts[name]:10} rows  {elapsed:8.1f} s  {counts[name] / max(elapsed, 1e-9):10.0f} rows/s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--classrooms", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--admins", type=int, default=1, help="the first N users are admins")
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor of the shared hash")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None,
+                        help="first order slot, default 30 days ago at 08:00")
+    parser.add_argument("--denied-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--commit-every", type=int, default=50000, help="rows per transaction")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables first")
+    args = parser.parse_args()
+
+    generate(args.users, args.classrooms, args.orders, args.password, args.admins, args.rounds,
+             args.start, args.denied_ratio, args.seed, args.batch_size, args.create_tables,
+             commit_every=args.commit_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# Production settings for `gunicorn -c gunicorn.conf.py classroom_booking.wsgi:app`.
+# Every value can be overridden through the environment.
+import multiprocessing
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WEB_THREADS", 1))
+worker_class = "gthread" if threads > 1 else "sync"
+# Import the app once in the master so workers fork with it already loaded.
+preload_app = os.environ.get("WEB_PRELOAD", "1") == "1"
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("WEB_KEEPALIVE", 5))
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", 0))
+
+
+def post_fork(server, worker):
+    # models resets the inherited pool through os.register_at_fork, here the
+    # worker opens its own connections before taking traffic.
+    from classroom_booking.app import warm_up
+    from classroom_booking.wsgi import app
+
+    warm_up(app)
+
+
+def worker_exit(server, worker):
+    from classroom_booking import hashing, models
+
+    hashing.pool.shutdown()
+    models.Session.remove()
+    models.engine.dispose()
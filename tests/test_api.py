@@ -1,14 +1,40 @@
 import base64
+import json
+import re
+import sqlite3
+import time
 import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from unittest.mock import ANY
 
 from flask import url_for, Flask
-from flask_bcrypt import generate_password_hash
+from flask_bcrypt import generate_password_hash, check_password_hash
 from flask_testing import TestCase
+from sqlalchemy import event, insert
 
 from classroom_booking import db_utils
-from classroom_booking.models import User, Session, Order, Classroom, BaseModel, engine
-from classroom_booking.app import app
+from classroom_booking.models import User, Session, SessionFactory, Order, Classroom, BaseModel, engine
+from classroom_booking.models import TimedQueuePool, CacheGeneration
+from classroom_booking.app import app, warm_up
+from classroom_booking.config import Config
+from classroom_booking import schemas, availability, cache, hashing
+from classroom_booking.schedule import merge_intervals, free_gaps, expand_recurrence, IntervalSet, OrderIntervals
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements executed inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", record)
 
 
 class BaseTestCase(TestCase):
@@ -133,6 +159,10 @@ class BaseTestCase(TestCase):
     def create_tables(self):
         BaseModel.metadata.drop_all(engine)
         BaseModel.metadata.create_all(engine)
+        cache.classrooms.clear()
+        cache.users.clear()
+        # Generations restart at 0 with the tables, the memo must not outlive them.
+        db_utils._availability_change = None
 
     def close_session(self):
         Session.close()
@@ -238,6 +268,390 @@ class TestUserSelf(BaseTestCase):
         self.assertEqual(str(resp), "<WrapperTestResponse streamed [401 UNAUTHORIZED]>")
 
 
+class TestUserToken(BaseTestCase):
+    def get_token(self, credentials):
+        resp = self.client.get(
+            url_for("api.user_login"),
+            headers=self.get_auth_basic(credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        return resp.json["token"]
+
+    def get_auth_bearer(self, token):
+        return {'Authorization': 'Bearer ' + token}
+
+    def test_token_grants_access(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        token = self.get_token(self.user1_credentials)
+
+        resp = self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token))
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json["username"], self.user1_data["username"])
+
+    def test_forged_token(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        token = self.get_token(self.user1_credentials)
+
+        resp = self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token[:-2] + "xx"))
+        self.assertEqual(401, resp.status_code)
+
+    def test_token_revoked_on_password_change(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        token = self.get_token(self.user1_credentials)
+
+        resp = self.client.put(
+            url_for("api.user_self"),
+            headers=self.get_auth_bearer(token),
+            json={"password": "user0"}
+        )
+        self.assertEqual(200, resp.status_code)
+
+        resp = self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token))
+        self.assertEqual(401, resp.status_code)
+
+        token = self.get_token({"username": "user1", "password": "user0"})
+        resp = self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token))
+        self.assertEqual(200, resp.status_code)
+
+    def test_token_revoked_on_delete(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        token = self.get_token(self.user1_credentials)
+
+        resp = self.client.delete(url_for("api.user_self"), headers=self.get_auth_bearer(token))
+        self.assertEqual(200, resp.status_code)
+
+        resp = self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token))
+        self.assertEqual(401, resp.status_code)
+
+    def test_token_check_needs_no_query(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        headers = self.get_auth_bearer(self.get_token(self.user1_credentials))
+        self.assertEqual(200, self.client.get(url_for("api.get_cache_stats"), headers=headers).status_code)
+
+        with count_queries() as statements:
+            resp = self.client.get(url_for("api.get_cache_stats"), headers=headers)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([], statements)
+
+    def test_token_revoked_by_other_worker(self):
+        self.addCleanup(setattr, cache.users, "sync_interval", cache.users.sync_interval)
+        cache.users.sync_interval = 0
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        token = self.get_token(self.user1_credentials)
+        self.assertEqual(200, self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token)).status_code)
+
+        # Another worker changes the password, this one still has the user cached.
+        with engine.begin() as connection:
+            connection.execute(User.__table__.update().values(password=generate_password_hash("user0").decode()))
+            connection.execute(CacheGeneration.__table__.insert().values(name="user", generation=1))
+        Session.rollback()
+
+        for resp in (self.client.get(url_for("api.user_self"), headers=self.get_auth_bearer(token)),
+                     self.client.post(url_for("api.find_classroom_by_status"), json=self.classroom_2statuses,
+                                      headers=self.get_auth_bearer(token)),
+                     self.client.get(url_for("api.find_available_classrooms", start="2030-01-01T00:00:00",
+                                             end="2030-01-02T00:00:00"), headers=self.get_auth_bearer(token)),
+                     self.client.get(url_for("api.classroom_schedule", classroom_id=1,
+                                             **{"from": "2030-01-01T00:00:00", "to": "2030-01-02T00:00:00"}),
+                                     headers=self.get_auth_bearer(token))):
+            self.assertEqual(401, resp.status_code)
+
+
+class TestCurrentUserCache(BaseTestCase):
+    def test_admin_call_loads_user_once(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        Session.remove()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            resp = self.client.get(
+                url_for("api.user_admin", user_name='user1'),
+                headers=self.get_auth_basic(self.user1_credentials)
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        self.assertEqual(200, resp.status_code)
+        # One lookup for the authenticated admin, one for the requested user.
+        user_queries = [x for x in statements if 'FROM user' in x]
+        self.assertEqual(2, len(user_queries))
+
+
+class TestUnitOfWork(BaseTestCase):
+    def count_commits(self, request):
+        commits = []
+
+        def after_commit(session):
+            commits.append(session)
+
+        event.listen(SessionFactory, "after_commit", after_commit)
+        try:
+            resp = request()
+        finally:
+            event.remove(SessionFactory, "after_commit", after_commit)
+        return resp, len(commits)
+
+    def test_write_request_commits_once(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp, commits = self.count_commits(lambda: self.client.put(
+            url_for("api.user_self"),
+            headers=self.get_auth_basic(self.user1_credentials),
+            json={"firstName": "changed"}
+        ))
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(1, commits)
+        self.assertEqual("changed", Session.query(User).one().firstName)
+
+    def test_read_request_does_not_commit(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp, commits = self.count_commits(lambda: self.client.get(
+            url_for("api.user_self"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        ))
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(0, commits)
+
+    def test_failed_request_rolls_back(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.put(
+            url_for("api.user_self"),
+            headers=self.get_auth_basic(self.user1_credentials),
+            json={"firstName": "1"}
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(self.user1_data["firstName"], Session.query(User).one().firstName)
+
+
+class TestPoolStats(BaseTestCase):
+    def test_pool_stats(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.get_pool_stats"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json["pool"], type(engine.pool).__name__)
+        self.assertEqual(resp.json["code"], 200)
+
+
+class TestClassroomCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+
+    def get_classroom(self):
+        return self.client.get(
+            url_for("api.classroom", classroom_id=1),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+
+    def test_hits_and_put_invalidation(self):
+        hits, misses = cache.classrooms.hits, cache.classrooms.misses
+        self.get_classroom()
+        resp = self.get_classroom()
+        self.assertEqual(resp.json["name"], self.classroom1_data["name"])
+        self.assertEqual((hits + 1, misses + 1), (cache.classrooms.hits, cache.classrooms.misses))
+
+        resp = self.client.put(
+            url_for("api.classroom", classroom_id=1),
+            json=self.classroom1_update_data,
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(self.get_classroom().json["name"], self.classroom1_update_data["name"])
+
+    def test_warm_up_loads_classrooms(self):
+        self.addCleanup(setattr, cache.classrooms, "sync_interval", cache.classrooms.sync_interval)
+        cache.classrooms.sync_interval = 3600
+        db_utils.create_entry(Classroom, **self.classroom2_data)
+        warm_up(app)
+        self.assertEqual(2, cache.classrooms.stats()["size"])
+
+        with count_queries() as statements:
+            self.assertEqual({1, 2}, set(db_utils.get_classrooms([1, 2])))
+        self.assertEqual([], statements)
+
+        cache.classrooms.clear()
+        self.assertEqual(2, db_utils.warm_classroom_cache(batch_size=1))
+
+    def test_write_from_another_worker(self):
+        self.addCleanup(setattr, cache.classrooms, "sync_interval", cache.classrooms.sync_interval)
+        cache.classrooms.sync_interval = 0
+        self.get_classroom()
+
+        with engine.begin() as connection:
+            connection.execute(Classroom.__table__.update().values(name="404"))
+            connection.execute(CacheGeneration.__table__.insert().values(name="classroom", generation=1))
+        Session.rollback()
+
+        self.assertEqual(self.get_classroom().json["name"], "404")
+
+    def test_streams_join_instead_of_cache(self):
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12), end_time=datetime(2030, 1, 1, 13))
+        hits, misses = cache.classrooms.hits, cache.classrooms.misses
+        headers = {**self.get_auth_basic(self.user1_credentials), "Accept": "application/x-ndjson"}
+
+        resp = self.client.get(url_for("api.get_self_orders"), headers=headers)
+        lines = [json.loads(x) for x in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines[0]["classroom_name"], self.classroom1_data["name"])
+
+        resp = self.client.post(url_for("api.find_classroom_by_status"), json=self.classroom_2statuses,
+                                headers=headers)
+        lines = [json.loads(x) for x in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines[0]["capacity"], self.classroom1_data["capacity"])
+        self.assertEqual((hits, misses), (cache.classrooms.hits, cache.classrooms.misses))
+
+    def test_etag_follows_cache_generation(self):
+        cache.classrooms.sync_interval = 3600
+        self.addCleanup(setattr, cache.classrooms, "sync_interval", Config.CLASSROOM_CACHE_SYNC_INTERVAL)
+        etag = self.get_classroom().headers["ETag"]
+
+        with engine.begin() as connection:
+            connection.execute(Classroom.__table__.update().values(name="404"))
+            connection.execute(CacheGeneration.__table__.insert().values(name="classroom", generation=1))
+        Session.rollback()
+
+        resp = self.client.get(
+            url_for("api.classroom", classroom_id=1),
+            headers={**self.get_auth_basic(self.user1_credentials), "If-None-Match": etag}
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("404", resp.json["name"])
+
+    def test_cache_stats(self):
+        resp = self.client.get(
+            url_for("api.get_cache_stats"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json["classrooms"]["max_size"], cache.classrooms.max_size)
+
+
+class TestConditionalRequests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        self.headers = self.get_auth_basic(self.user1_credentials)
+
+    def test_classroom_not_modified(self):
+        resp = self.client.get(url_for("api.classroom", classroom_id=1), headers=self.headers)
+        etag = resp.headers["ETag"]
+
+        resp = self.client.get(url_for("api.classroom", classroom_id=1),
+                               headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b"", resp.data)
+
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime.now() - timedelta(hours=1),
+                              end_time=datetime.now() + timedelta(hours=1))
+        resp = self.client.get(url_for("api.classroom", classroom_id=1),
+                               headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("unavailable", resp.json["classroomStatus"])
+
+    def test_find_by_status_and_self_orders_not_modified(self):
+        for request in (lambda **kw: self.client.post(url_for("api.find_classroom_by_status"),
+                                                      json=self.classroom_2statuses, **kw),
+                        lambda **kw: self.client.get(url_for("api.get_self_orders"), **kw)):
+            etag = request(headers=self.headers).headers["ETag"]
+            self.assertEqual(304, request(headers={**self.headers, "If-None-Match": etag}).status_code)
+
+            resp = self.client.put(url_for("api.classroom", classroom_id=1),
+                                   json=self.classroom1_update_data, headers=self.headers)
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(200, request(headers={**self.headers, "If-None-Match": etag}).status_code)
+
+    def test_etags_follow_their_own_resource(self):
+        db_utils.create_entry(User, **self.user2_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom2_data)
+        order_id = db_utils.create_order(classroomId=1, userId=1,
+                                         start_time=datetime(2030, 1, 1, 12), end_time=datetime(2030, 1, 1, 13)).id
+        classroom = lambda **kw: self.client.get(url_for("api.classroom", classroom_id=1), **kw)
+        orders = lambda **kw: self.client.get(url_for("api.get_self_orders"), **kw)
+        etags = [classroom(headers=self.headers).headers["ETag"], orders(headers=self.headers).headers["ETag"]]
+
+        db_utils.create_order(classroomId=2, userId=2,
+                              start_time=datetime(2030, 1, 1, 12), end_time=datetime(2030, 1, 1, 13))
+        self.assertEqual(304, classroom(headers={**self.headers, "If-None-Match": etags[0]}).status_code)
+        self.assertEqual(304, orders(headers={**self.headers, "If-None-Match": etags[1]}).status_code)
+
+        db_utils.cancel_order(db_utils.get_entry_by_id(Order, order_id))
+        self.assertEqual(200, classroom(headers={**self.headers, "If-None-Match": etags[0]}).status_code)
+        resp = orders(headers={**self.headers, "If-None-Match": etags[1]})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([{"code": 200}], resp.json)
+
+    def test_next_availability_change(self):
+        now = datetime(2030, 1, 1, 10)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12),
+                              end_time=datetime(2030, 1, 1, 14))
+        signal = db_utils.booking_signal()
+
+        self.assertEqual((datetime(2030, 1, 1, 12), datetime(2030, 1, 1, 14)),
+                         db_utils.next_availability_change(signal, now))
+        self.assertEqual((None, datetime(2030, 1, 1, 14)),
+                         db_utils.next_availability_change(signal, datetime(2030, 1, 1, 13)))
+        self.assertEqual((None, None), db_utils.next_availability_change(signal, datetime(2030, 1, 1, 15)))
+
+
+class TestMetrics(BaseTestCase):
+    def test_server_timing_and_metrics(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.user_self"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        timing = resp.headers["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertIn("bcrypt;dur=", timing)
+        self.assertIn("serialize;dur=", timing)
+
+        resp = self.client.get(url_for("api.get_metrics"))
+        self.assertEqual(200, resp.status_code)
+        body = resp.data.decode()
+        self.assertIn('http_request_duration_seconds_count{endpoint="api.user_self"}', body)
+        self.assertIn('http_requests_total{endpoint="api.user_self",status="200"}', body)
+        self.assertRegex(body, r'db_queries_total\{endpoint="api.user_self"\} [1-9]')
+        self.assertIn('bcrypt_seconds_total{endpoint="api.user_self"}', body)
+
+    def metric(self, name, endpoint):
+        body = self.client.get(url_for("api.get_metrics")).data.decode()
+        match = re.search(rf'^{name}\{{endpoint="{endpoint}"\}} (\S+)$', body, re.M)
+        return float(match.group(1)) if match else 0.0
+
+    def test_streamed_body_is_recorded(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        for day in range(1, 4):
+            db_utils.create_order(classroomId=1, userId=1,
+                                  start_time=datetime(2030, 1, day, 12), end_time=datetime(2030, 1, day, 13))
+        endpoint = "api.get_self_orders"
+        count = self.metric("http_request_duration_seconds_count", endpoint)
+        queries = self.metric("db_queries_total", endpoint)
+        serialize = self.metric("serialize_seconds_total", endpoint)
+
+        with count_queries() as statements:
+            resp = self.client.get(url_for(endpoint, stream=1), headers=self.get_auth_basic(self.user1_credentials))
+            self.assertEqual(4, len(resp.get_data(as_text=True).splitlines()))
+            resp.close()
+
+        self.assertEqual(count + 1, self.metric("http_request_duration_seconds_count", endpoint))
+        # The list query runs while the body is written, after after_request.
+        self.assertEqual(queries + len(statements), self.metric("db_queries_total", endpoint))
+        self.assertGreater(self.metric("serialize_seconds_total", endpoint), serialize)
+
+
 class TestCreateUser(BaseTestCase):
     def test_create_user(self):
         resp = self.client.post(
@@ -262,6 +676,125 @@ class TestCreateUser(BaseTestCase):
         )
 
 
+class TestPasswordHashing(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        limit, rounds = hashing.pool.queue_limit, hashing.pool.rounds
+        self.addCleanup(setattr, hashing.pool, "queue_limit", limit)
+        self.addCleanup(setattr, hashing.pool, "rounds", rounds)
+
+    def test_hash_in_pool(self):
+        hashing.pool.rounds = 4
+        password_hash = hashing.hash_password("secret")
+        self.assertTrue(password_hash.startswith("$2b$04$"))
+        self.assertTrue(check_password_hash(password_hash, "secret"))
+        self.assertEqual(0, hashing.pool.in_flight)
+
+    def test_timed_out_hash_keeps_its_slot(self):
+        hashing.pool.rounds = 4
+        hashing.hash_password("warm up")
+        timeout = hashing.pool.timeout
+        self.addCleanup(setattr, hashing.pool, "timeout", timeout)
+        hashing.pool.queue_limit, hashing.pool.rounds, hashing.pool.timeout = 1, 14, 0.01
+
+        with self.assertRaisesRegex(hashing.HashingUnavailable, "timed out"):
+            hashing.hash_password("secret")
+        # The job still runs in the pool and holds the only slot.
+        with self.assertRaisesRegex(hashing.HashingUnavailable, "Too many"):
+            hashing.hash_password("secret")
+
+        deadline = time.monotonic() + 60
+        while hashing.pool.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(0, hashing.pool.in_flight)
+
+    def test_saturated_pool(self):
+        hashing.pool.queue_limit = 0
+        rejected = hashing.pool.rejected
+        resp = self.client.post(
+            url_for("api.create_user"),
+            json=self.user2_data
+        )
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual("1", resp.headers["Retry-After"])
+        self.assertEqual(rejected + 1, hashing.pool.rejected)
+        self.assertIsNone(Session.query(User).filter_by(username=self.user2_data["username"]).first())
+
+
+class TestBulkUsers(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, hashing.pool, "rounds", hashing.pool.rounds)
+        hashing.pool.rounds = 4
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(User, **self.user2_data_hashed)
+        self.headers = self.get_auth_basic(self.user1_credentials)
+        self.rows = [{**self.user2_data, "username": f"student{i}", "password": f"secret{i}"} for i in range(3)]
+
+    def test_partial(self):
+        rows = self.rows + [{**self.rows[0], "email": "other@gmail.com"},
+                            {**self.user2_data},
+                            {**self.rows[1], "username": "student9", "email": "invalid"}]
+        with count_queries() as statements:
+            resp = self.client.post(url_for("api.create_users_bulk"),
+                                    json={"users": rows, "mode": "partial"}, headers=self.headers)
+        self.assertEqual(200, resp.status_code, resp.json)
+        self.assertEqual(3, resp.json["created"])
+        self.assertEqual(["created"] * 3 + ["rejected"] * 3, [x["status"] for x in resp.json["results"]])
+        self.assertEqual("Username is already used by row 0", resp.json["results"][3]["error"])
+        self.assertEqual("User with entered username already exists", resp.json["results"][4]["error"])
+        self.assertIn("email", resp.json["results"][5]["error"])
+        # user lookup, username check, inserts, ids
+        self.assertLessEqual(len(statements), 5, "\n".join(statements))
+
+        user = Session.query(User).filter_by(username="student2").one()
+        self.assertEqual(resp.json["results"][2]["id"], user.id)
+        self.assertEqual('1', user.userStatus)
+        self.assertTrue(check_password_hash(user.password, "secret2"))
+
+    def test_all_or_nothing(self):
+        resp = self.client.post(url_for("api.create_users_bulk"),
+                                json={"users": self.rows + [self.user2_data]}, headers=self.headers)
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(0, resp.json["created"])
+        self.assertEqual("Not created because another row failed", resp.json["results"][0]["error"])
+        self.assertEqual(2, Session.query(User).count())
+
+    def test_csv(self):
+        body = "username,firstName,lastName,email,password,phone\n" \
+               "student1,Ann,Smith,ann@gmail.com,secret1,\n" \
+               "student2,Bob,Jones,bob@gmail.com,secret2,+380961010101\n"
+        resp = self.client.post(url_for("api.create_users_bulk"), data=body,
+                                content_type="text/csv", headers=self.headers)
+        self.assertEqual(200, resp.status_code, resp.json)
+        self.assertEqual(2, resp.json["created"])
+        self.assertIsNone(Session.query(User).filter_by(username="student1").one().phone)
+
+    def test_row_limit(self):
+        app.config["BULK_USERS_MAX_ROWS"] = 2
+        self.addCleanup(app.config.__setitem__, "BULK_USERS_MAX_ROWS", Config.BULK_USERS_MAX_ROWS)
+        resp = self.client.post(url_for("api.create_users_bulk"), json={"users": self.rows}, headers=self.headers)
+        self.assertEqual(400, resp.status_code)
+        self.assertIn("At most 2 users", resp.json["error"])
+        self.assertEqual(2, Session.query(User).count())
+
+    def test_hashing_timeout(self):
+        hashing.pool.rounds = 14
+        with self.assertRaisesRegex(hashing.HashingUnavailable, "timed out"):
+            hashing.hash_passwords(["a", "b", "c"], timeout=0.01)
+        # Running hashes keep the slot until the processes exit.
+        deadline = time.monotonic() + 60
+        while hashing.pool.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(0, hashing.pool.in_flight)
+
+    def test_admin_required(self):
+        resp = self.client.post(url_for("api.create_users_bulk"), json={"users": self.rows},
+                                headers=self.get_auth_basic(self.user2_credentials))
+        self.assertEqual(401, resp.status_code)
+        self.assertEqual(2, Session.query(User).count())
+
+
 class TestGetUserById(BaseTestCase):
     def test_get_user_by_id(self):
         db_utils.create_entry(User, **self.user1_data_hashed)
@@ -449,6 +982,129 @@ class TestGetClassroomsByStatus(BaseTestCase):
                                               "elements should be strings \'available' or 'unavailable' ",
                                      "code": 400})
 
+    def test_get_classrooms_by_status_derived_from_orders(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        db_utils.create_entry(Classroom, **self.classroom2_data)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime.now() - timedelta(hours=1),
+                              end_time=datetime.now() + timedelta(hours=1))
+
+        resp = self.client.post(
+            url_for("api.find_classroom_by_status"),
+            json={"status": ['unavailable']},
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json, [
+            {
+                "capacity": self.classroom1_data["capacity"],
+                "classroomStatus": "unavailable",
+                "name": self.classroom1_data["name"],
+                "id": 1
+            },
+            {
+                "code": 200
+            }
+        ])
+
+
+class TestAvailableClassrooms(BaseTestCase):
+    def test_available_classrooms_best_fit_first(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, name="big", capacity=50)
+        db_utils.create_entry(Classroom, name="small", capacity=5)
+        db_utils.create_entry(Classroom, name="medium", capacity=20)
+        db_utils.create_entry(Classroom, name="booked", capacity=10)
+        db_utils.create_order(classroomId=4, userId=1,
+                              start_time=datetime(2030, 1, 1, 11),
+                              end_time=datetime(2030, 1, 1, 13))
+
+        resp = self.client.get(
+            url_for("api.find_available_classrooms", start="2030-01-01 12:00:00",
+                    end="2030-01-01 14:00:00", min_capacity=8),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([x.get("name") for x in resp.json], ["medium", "big", None])
+        self.assertEqual(resp.json[-1], {"code": 200})
+
+    def test_available_classrooms_invalid_range(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.find_available_classrooms", start="2030-01-01 14:00:00",
+                    end="2030-01-01 12:00:00"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(400, resp.status_code)
+
+
+class TestClassroomSchedule(BaseTestCase):
+    def test_classroom_schedule(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 7),
+                              end_time=datetime(2030, 1, 1, 9))
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12),
+                              end_time=datetime(2030, 1, 1, 13))
+
+        resp = self.client.get(
+            url_for("api.classroom_schedule", classroom_id=1,
+                    **{"from": "2030-01-01 08:00:00", "to": "2030-01-01 18:00:00"}),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json, {
+            "classroomId": 1,
+            "from": "2030-01-01 08:00:00",
+            "to": "2030-01-01 18:00:00",
+            "booked": [
+                {"id": 1, "start_time": "2030-01-01 07:00:00", "end_time": "2030-01-01 09:00:00"},
+                {"id": 2, "start_time": "2030-01-01 12:00:00", "end_time": "2030-01-01 13:00:00"},
+            ],
+            "free": [
+                {"start_time": "2030-01-01 09:00:00", "end_time": "2030-01-01 12:00:00"},
+                {"start_time": "2030-01-01 13:00:00", "end_time": "2030-01-01 18:00:00"},
+            ],
+            "code": 200
+        })
+
+    def test_classroom_schedule_doesnt_exist(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.classroom_schedule", classroom_id=1,
+                    **{"from": "2030-01-01 08:00:00", "to": "2030-01-01 18:00:00"}),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(404, resp.status_code)
+
+
+class TestScheduleIntervals(unittest.TestCase):
+    def test_merge_intervals(self):
+        self.assertEqual(merge_intervals([(1, 3), (2, 4), (4, 5), (7, 8)]), [(1, 5), (7, 8)])
+
+    def test_free_gaps(self):
+        self.assertEqual(free_gaps([], 0, 10), [(0, 10)])
+        self.assertEqual(free_gaps([(-2, 1), (3, 4), (3, 5), (9, 12)], 0, 10), [(1, 3), (5, 9)])
+        self.assertEqual(free_gaps([(0, 10)], 0, 10), [])
+
+    def test_expand_recurrence(self):
+        self.assertEqual(expand_recurrence(0, 2, 7, 21), [(0, 2), (7, 9), (14, 16), (21, 23)])
+        self.assertEqual(IntervalSet([(8, 15), (20, 22)]).overlapping(expand_recurrence(0, 2, 7, 21)),
+                         [1, 2, 3])
+
+    def test_order_intervals(self):
+        intervals = OrderIntervals([(5, 6), (0, 10), (12, 14)])
+        self.assertTrue(intervals.overlaps(7, 8))
+        self.assertTrue(intervals.remove(0, 10))
+        self.assertFalse(intervals.overlaps(7, 8))
+        self.assertFalse(intervals.remove(0, 10))
+        intervals.add(8, 13)
+        self.assertTrue(intervals.overlaps(7, 9))
+        self.assertFalse(intervals.overlaps(14, 16))
+
 
 class TestActionClassroom(BaseTestCase):
     def test_get_classroom_by_id(self):
@@ -558,6 +1214,234 @@ class TestCreateOrder(BaseTestCase):
                                      "code": 400})
 
 
+class TestClassroomFreeInRange(BaseTestCase):
+    def test_overlap_and_adjacent_ranges(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12),
+                              end_time=datetime(2030, 1, 1, 14))
+
+        free = db_utils.is_classroom_free_in_range
+        self.assertFalse(free(1, datetime(2030, 1, 1, 11), datetime(2030, 1, 1, 13)))
+        self.assertFalse(free(1, datetime(2030, 1, 1, 13), datetime(2030, 1, 1, 15)))
+        self.assertFalse(free(1, datetime(2030, 1, 1, 12, 30), datetime(2030, 1, 1, 13)))
+        self.assertFalse(free(1, datetime(2030, 1, 1, 11), datetime(2030, 1, 1, 15)))
+        self.assertTrue(free(1, datetime(2030, 1, 1, 10), datetime(2030, 1, 1, 12)))
+        self.assertTrue(free(1, datetime(2030, 1, 1, 14), datetime(2030, 1, 1, 16)))
+        self.assertTrue(free(2, datetime(2030, 1, 1, 12), datetime(2030, 1, 1, 14)))
+
+    def test_book_classroom_rejects_overlap(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        booking = dict(classroomId=1, userId=1,
+                       start_time=datetime(2030, 1, 1, 12),
+                       end_time=datetime(2030, 1, 1, 14))
+
+        self.assertIsNotNone(db_utils.book_classroom(**booking))
+        self.assertIsNone(db_utils.book_classroom(**booking))
+        self.assertEqual(1, Session.query(Order).count())
+
+
+class TestAvailabilityIndex(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        availability.index.enabled = True
+        availability.index.clear()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12),
+                              end_time=datetime(2030, 1, 1, 14))
+
+    def tearDown(self):
+        availability.index.enabled = False
+        availability.index.clear()
+        super().tearDown()
+
+    def test_index_follows_local_writes(self):
+        free = db_utils.is_classroom_free_in_range
+        rebuilds = availability.index.rebuilds
+        self.assertFalse(free(1, datetime(2030, 1, 1, 13), datetime(2030, 1, 1, 15)))
+        self.assertTrue(free(1, datetime(2030, 1, 1, 14), datetime(2030, 1, 1, 16)))
+        self.assertEqual(rebuilds + 1, availability.index.rebuilds)
+
+        order = db_utils.create_order(classroomId=1, userId=1,
+                                      start_time=datetime(2030, 1, 1, 14),
+                                      end_time=datetime(2030, 1, 1, 16))
+        self.assertFalse(free(1, datetime(2030, 1, 1, 15), datetime(2030, 1, 1, 17)))
+
+        resp = self.client.delete(
+            url_for("api.order", order_id=order.id),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(free(1, datetime(2030, 1, 1, 15), datetime(2030, 1, 1, 17)))
+        self.assertEqual(rebuilds + 1, availability.index.rebuilds)
+
+    def test_index_rebuilds_after_foreign_write(self):
+        free = db_utils.is_classroom_free_in_range
+        rebuilds = availability.index.rebuilds
+        self.assertTrue(free(1, datetime(2030, 1, 2, 12), datetime(2030, 1, 2, 14)))
+
+        # Another worker: its order and version bump bypass this index.
+        with engine.begin() as connection:
+            connection.execute(Order.__table__.insert().values(
+                classroomId=1, userId=1, orderStatus='placed',
+                start_time=datetime(2030, 1, 2, 12), end_time=datetime(2030, 1, 2, 14)))
+            connection.execute(Classroom.__table__.update().values(
+                bookingVersion=Classroom.__table__.c.bookingVersion + 1))
+        Session.rollback()
+
+        self.assertFalse(free(1, datetime(2030, 1, 2, 12), datetime(2030, 1, 2, 14)))
+        self.assertEqual(rebuilds + 2, availability.index.rebuilds)
+        self.assertIsNone(db_utils.book_classroom(classroomId=1, userId=1,
+                                                  start_time=datetime(2030, 1, 2, 13),
+                                                  end_time=datetime(2030, 1, 2, 15)))
+
+    def test_index_ignores_rolled_back_write(self):
+        free = db_utils.is_classroom_free_in_range
+        self.assertTrue(free(1, datetime(2030, 1, 2, 12), datetime(2030, 1, 2, 14)))
+
+        db_utils.create_order(commit=False, classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 2, 12), end_time=datetime(2030, 1, 2, 14))
+        Session.rollback()
+
+        # One booking by another worker brings the version back to where the
+        # rolled back write would have left it.
+        with engine.begin() as connection:
+            connection.execute(Order.__table__.insert().values(
+                classroomId=1, userId=1, orderStatus='placed',
+                start_time=datetime(2030, 1, 3, 12), end_time=datetime(2030, 1, 3, 14)))
+            connection.execute(Classroom.__table__.update().values(
+                bookingVersion=Classroom.__table__.c.bookingVersion + 1))
+        Session.rollback()
+
+        self.assertTrue(free(1, datetime(2030, 1, 2, 12), datetime(2030, 1, 2, 14)))
+        self.assertFalse(free(1, datetime(2030, 1, 3, 12), datetime(2030, 1, 3, 14)))
+
+
+class TestBatchOrders(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        db_utils.create_entry(Classroom, **self.classroom2_data)
+        db_utils.create_order(classroomId=1, userId=1,
+                              start_time=datetime(2030, 1, 1, 12),
+                              end_time=datetime(2030, 1, 1, 14))
+        self.batch = [
+            {"classroomId": 1, "start_time": "2030-01-01 14:00:00", "end_time": "2030-01-01 15:00:00"},
+            {"classroomId": 1, "start_time": "2030-01-01 13:00:00", "end_time": "2030-01-01 15:00:00"},
+            {"classroomId": 2, "start_time": "2030-01-01 12:00:00", "end_time": "2030-01-01 14:00:00"},
+            {"classroomId": 2, "start_time": "2030-01-01 13:00:00", "end_time": "2030-01-01 15:00:00"},
+            {"classroomId": 3, "start_time": "2030-01-01 12:00:00", "end_time": "2030-01-01 14:00:00"},
+        ]
+
+    def post_batch(self, mode):
+        return self.client.post(
+            url_for("api.place_orders_batch"),
+            json={"orders": self.batch, "mode": mode},
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+
+    def test_batch_partial(self):
+        resp = self.post_batch("partial")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(2, resp.json["placed"])
+        self.assertEqual([x["status"] for x in resp.json["results"]],
+                         ["placed", "rejected", "placed", "rejected", "rejected"])
+        self.assertEqual(resp.json["results"][0]["order"], {
+            "id": 2,
+            "classroomId": 1,
+            "userId": 1,
+            "start_time": "2030-01-01T14:00:00",
+            "end_time": "2030-01-01T15:00:00",
+            "orderStatus": "placed",
+        })
+        self.assertEqual(3, Session.query(Order).count())
+
+    def test_batch_all_or_nothing(self):
+        resp = self.post_batch("all_or_nothing")
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(0, resp.json["placed"])
+        self.assertEqual(1, Session.query(Order).count())
+
+        self.batch = [self.batch[0], self.batch[2]]
+        resp = self.post_batch("all_or_nothing")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(2, resp.json["placed"])
+        self.assertEqual(3, Session.query(Order).count())
+
+
+class TestRecurringOrders(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(User, **self.user2_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        self.series = {
+            "classroomId": 1,
+            "start_time": "2030-01-01 10:00:00",
+            "end_time": "2030-01-01 12:00:00",
+            "frequency": "weekly",
+            "until": "2030-01-29 10:00:00",
+        }
+
+    def post_series(self):
+        return self.client.post(
+            url_for("api.place_series"),
+            json=self.series,
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+
+    def test_place_series(self):
+        resp = self.post_series()
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(["2030-01-01T10:00:00", "2030-01-08T10:00:00", "2030-01-15T10:00:00",
+                          "2030-01-22T10:00:00", "2030-01-29T10:00:00"],
+                         [x["start_time"] for x in resp.json["orders"]])
+        self.assertEqual(5, Session.query(Order).filter_by(seriesId=resp.json["seriesId"]).count())
+
+        resp = self.client.get(
+            url_for("api.series", series_id=resp.json["seriesId"]),
+            headers=self.get_auth_basic(self.user2_credentials)
+        )
+        self.assertEqual(402, resp.status_code)
+
+    def test_place_series_conflict(self):
+        db_utils.create_order(classroomId=1, userId=2,
+                              start_time=datetime(2030, 1, 15, 11),
+                              end_time=datetime(2030, 1, 15, 13))
+
+        resp = self.post_series()
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual([{"start_time": "2030-01-15 10:00:00", "end_time": "2030-01-15 12:00:00"}],
+                         resp.json["conflicts"])
+        self.assertEqual(1, Session.query(Order).count())
+
+    def test_place_series_overlapping_occurrences(self):
+        self.series.update(start_time="2030-01-01 10:00:00", end_time="2030-01-04 10:00:00",
+                           frequency="daily", until="2030-01-03 10:00:00")
+
+        resp = self.post_series()
+        self.assertEqual(400, resp.status_code)
+        self.assertIn("end_time", resp.json["error"])
+        self.assertEqual(0, Session.query(Order).count())
+
+    def test_cancel_series(self):
+        series_id = self.post_series().json["seriesId"]
+
+        resp = self.client.delete(
+            url_for("api.series", series_id=series_id),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(5, resp.json["cancelled"])
+        self.assertEqual({"denied"}, {x["orderStatus"] for x in resp.json["orders"]})
+        self.assertTrue(db_utils.is_classroom_free_in_range(1, datetime(2030, 1, 1), datetime(2030, 2, 1)))
+
+
 class TestGetOrdersByStatus(BaseTestCase):
     def test_get_classrooms_by_status(self):
         db_utils.create_entry(User, **self.user1_data_hashed)
@@ -599,6 +1483,70 @@ class TestGetOrdersByStatus(BaseTestCase):
         ])
 
 
+class TestOrdersPagination(BaseTestCase):
+    def test_get_orders_by_userid_pages(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        for day in range(1, 6):
+            db_utils.create_order(classroomId=1, userId=1,
+                                  start_time=datetime(2030, 1, day, 12),
+                                  end_time=datetime(2030, 1, day, 13))
+
+        ids = []
+        cursor = None
+        for _ in range(3):
+            query = {"limit": 2}
+            if cursor is not None:
+                query["after"] = cursor
+            resp = self.client.get(
+                url_for("api.get_all_orders", userid=1, **query),
+                headers=self.get_auth_basic(self.user1_credentials)
+            )
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(resp.json[-1], {"code": 200})
+            ids += [x["id"] for x in resp.json[:-1]]
+            cursor = resp.headers.get("X-Next-Cursor")
+
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertIsNone(cursor)
+
+    def test_cursor_header_exposed_to_browsers(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.get_all_orders", userid=1, limit=2),
+            headers={**self.get_auth_basic(self.user1_credentials), "Origin": "https://dashboard.example.com"}
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertIn("X-Next-Cursor", resp.headers["Access-Control-Expose-Headers"])
+
+    def test_invalid_cursor(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        resp = self.client.get(
+            url_for("api.get_all_orders", userid=1, after="!!"),
+            headers=self.get_auth_basic(self.user1_credentials)
+        )
+        self.assertEqual(400, resp.status_code)
+
+    def test_get_orders_by_userid_stream(self):
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(Classroom, **self.classroom1_data)
+        for day in range(1, 4):
+            db_utils.create_order(classroomId=1, userId=1,
+                                  start_time=datetime(2030, 1, day, 12),
+                                  end_time=datetime(2030, 1, day, 13))
+
+        resp = self.client.get(
+            url_for("api.get_all_orders", userid=1, limit=1),
+            headers={**self.get_auth_basic(self.user1_credentials), "Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("application/x-ndjson", resp.mimetype)
+        lines = [json.loads(x) for x in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([x["id"] for x in lines[:-1]], [1, 2, 3])
+        self.assertEqual(lines[-1], {"code": 200})
+        self.assertEqual(lines[0]["start_time"], "2030-01-01T12:00:00")
+
+
 class TestActionOrder(BaseTestCase):
     def test_get_order_by_id(self):
         db_utils.create_entry(User, **self.user1_data_hashed)
@@ -659,27 +1607,151 @@ class TestGetOrders(BaseTestCase):
         )
 
         self.assertEqual(200, resp.status_code)
-        start_time1 = self.order1_data["start_time"].split(' ')[0] + "T" + self.order1_data["start_time"].split(' ')[1]
-        start_time2 = self.order2_data["start_time"].split(' ')[0] + "T" + self.order2_data["start_time"].split(' ')[1]
-        end_time1 = self.order1_data["end_time"].split(' ')[0] + "T" + self.order1_data["end_time"].split(' ')[1]
-        end_time2 = self.order2_data["end_time"].split(' ')[0] + "T" + self.order2_data["end_time"].split(' ')[1]
         self.assertEqual(resp.json, [{
             "classroomId": self.order1_data["classroomId"],
-            "start_time": start_time1,
-            "end_time": end_time1,
+            "start_time": self.order1_data["start_time"],
+            "end_time": self.order1_data["end_time"],
             "orderStatus": ANY,
             "id": ANY,
-            "userId": 1
+            "userId": 1,
+            "classroom_name": self.classroom1_data["name"],
+            "classroom_capacity": self.classroom1_data["capacity"],
         }, {
             "classroomId": self.order2_data["classroomId"],
-            "start_time": start_time2,
-            "end_time": end_time2,
+            "start_time": self.order2_data["start_time"],
+            "end_time": self.order2_data["end_time"],
             "orderStatus": ANY,
             "id": ANY,
-            "userId": 1
+            "userId": 1,
+            "classroom_name": self.classroom2_data["name"],
+            "classroom_capacity": self.classroom2_data["capacity"],
         },
             {"code": 200}])
 
 
+class TestQueryBudgets(BaseTestCase):
+    """Statements per request on a dataset with hundreds of rows, cold caches.
+
+    Budgets do not depend on the number of rows, a per-row query breaks them.
+    """
+    CLASSROOMS = 200
+    ORDERS = 600
+
+    def setUp(self):
+        super().setUp()
+        db_utils.create_entry(User, **self.user1_data_hashed)
+        db_utils.create_entry(User, **self.user2_data_hashed)
+        with engine.begin() as connection:
+            connection.execute(insert(Classroom), [{"name": f"room{i}", "capacity": 10 + i % 40}
+                                                   for i in range(self.CLASSROOMS)])
+            connection.execute(insert(Order), [{"classroomId": i % self.CLASSROOMS + 1,
+                                                "userId": 1 + i % 2,
+                                                "orderStatus": 'denied' if i % 5 == 0 else 'placed',
+                                                "start_time": datetime(2030, 1, 1) + timedelta(hours=2 * i),
+                                                "end_time": datetime(2030, 1, 1) + timedelta(hours=2 * i + 1)}
+                                               for i in range(self.ORDERS)])
+            # Seeded by the migrations, as in a deployed database.
+            connection.execute(insert(CacheGeneration), [{"name": "classroom", "generation": 0},
+                                                         {"name": "booking", "generation": 0}])
+        self.headers = self.get_auth_basic(self.user1_credentials)
+
+    def assertQueryBudget(self, budget, request):
+        with count_queries() as statements:
+            resp = request()
+            resp.get_data()
+        self.assertEqual(200, resp.status_code, resp.data)
+        self.assertLessEqual(len(statements), budget, "\n".join(statements))
+        return resp
+
+    def test_list_endpoints(self):
+        # Cold classroom cache: user lookup, ETag signal and orders page, then
+        # the page's classrooms are loaded with one IN query. The cache takes
+        # the classroom generation from the signal instead of reading it.
+        resp = self.assertQueryBudget(4, lambda: self.client.get(
+            url_for("api.get_self_orders", limit=1000), headers=self.headers))
+        self.assertEqual(self.ORDERS // 2 * 4 // 5 + 1, len(resp.json))
+
+        # Warm classroom cache: orders page, ETag signal and the user lookup.
+        cache.classrooms.sync_interval = 3600
+        self.addCleanup(setattr, cache.classrooms, "sync_interval", Config.CLASSROOM_CACHE_SYNC_INTERVAL)
+        self.assertQueryBudget(3, lambda: self.client.get(
+            url_for("api.get_self_orders", limit=1000), headers=self.headers))
+
+        # Streams join the classrooms instead of using the cache.
+        self.assertQueryBudget(3, lambda: self.client.get(
+            url_for("api.get_self_orders", stream=1), headers=self.headers))
+        # The next availability change is looked up once per booking signal.
+        self.assertQueryBudget(6, lambda: self.client.post(
+            url_for("api.find_classroom_by_status", limit=1000), json=self.classroom_2statuses, headers=self.headers))
+        self.assertQueryBudget(3, lambda: self.client.get(
+            url_for("api.get_all_orders", userid=2, limit=1000), headers=self.headers))
+        self.assertQueryBudget(2, lambda: self.client.get(
+            url_for("api.get_orders_by_status", limit=1000), json=self.order_2statuses, headers=self.headers))
+
+    def test_classroom_endpoints(self):
+        # User lookup, the classroom's signal, its cached row and availability.
+        self.assertQueryBudget(4, lambda: self.client.get(
+            url_for("api.classroom", classroom_id=5), headers=self.headers))
+        self.assertQueryBudget(2, lambda: self.client.get(
+            url_for("api.find_available_classrooms", start="2030-01-01T00:00:00", end="2030-01-02T00:00:00",
+                    limit=1000), headers=self.headers))
+        self.assertQueryBudget(3, lambda: self.client.get(
+            url_for("api.classroom_schedule", classroom_id=5,
+                    **{"from": "2030-01-01T00:00:00", "to": "2030-01-31T00:00:00"}), headers=self.headers))
+
+    def test_booking_endpoints(self):
+        # Writes also bump the classrooms' bookingVersion, the users'
+        # orderVersion and the booking generation, one statement each.
+        orders = [{"classroomId": i % self.CLASSROOMS + 1,
+                   "start_time": f"2031-01-0{1 + i // self.CLASSROOMS} 10:00:00",
+                   "end_time": f"2031-01-0{1 + i // self.CLASSROOMS} 11:00:00"} for i in range(300)]
+        self.assertQueryBudget(8, lambda: self.client.post(
+            url_for("api.place_orders_batch"), json={"orders": orders}, headers=self.headers))
+
+        resp = self.assertQueryBudget(9, lambda: self.client.post(
+            url_for("api.place_series"), json={"classroomId": 7,
+                                               "start_time": "2032-01-01 10:00:00",
+                                               "end_time": "2032-01-01 12:00:00",
+                                               "until": "2032-12-31 10:00:00"}, headers=self.headers))
+        series_id = resp.json["seriesId"]
+        self.assertQueryBudget(2, lambda: self.client.get(
+            url_for("api.series", series_id=series_id), headers=self.headers))
+        self.assertQueryBudget(9, lambda: self.client.delete(
+            url_for("api.series", series_id=series_id), headers=self.headers))
+
+
+class TestCompiledDump(unittest.TestCase):
+    def test_compiled_dumps_match_marshmallow(self):
+        order = Order(id=1, classroomId=2, userId=3, orderStatus='placed',
+                      start_time=datetime(2030, 1, 1, 12), end_time=datetime(2030, 1, 1, 13))
+        user = User(id=1, username="user1", firstName="user1", email="user1@gmail.com",
+                    birthDate=datetime(2000, 1, 1).date(), userStatus='1', isAdmin='0')
+        classroom = Classroom(id=1, name="101", capacity=11, classroomStatus='available')
+
+        cases = (
+            (schemas.dump_order_data, schemas.order_data_schema, order),
+            (schemas.dump_user_data, schemas.user_data_schema, user),
+            (schemas.dump_get_user, schemas.get_user_schema, user),
+            (schemas.dump_classroom_data, schemas.classroom_data_schema, classroom),
+        )
+        for dump, schema, obj in cases:
+            self.assertIsNot(dump, schema.dump)
+            self.assertEqual(dump(obj), schema.dump(obj))
+            self.assertEqual(dump([obj, obj], many=True), schema.dump([obj, obj], many=True))
+
+
+class TestTimedQueuePool(unittest.TestCase):
+    def test_checkouts_are_counted(self):
+        pool = TimedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=2, max_overflow=0)
+        first = pool.connect()
+        second = pool.connect()
+        self.assertEqual(2, pool.checkedout())
+        self.assertEqual(2, pool.checkouts)
+        first.close()
+        second.close()
+        self.assertEqual(0, pool.checkedout())
+        self.assertGreaterEqual(pool.max_wait_time, 0)
+
+
 if __name__ == "__main__":
     unittest.main()